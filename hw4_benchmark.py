@@ -0,0 +1,244 @@
+from __future__ import with_statement
+import argparse
+import csv
+import json
+import multiprocessing
+import random
+import subprocess
+import sys
+import time
+from timeit import default_timer
+
+from hw4_p1 import naive_bayes, naive_bayes_log
+from hw4_p2 import learn_discrete, learn_naive_bayes, learn_naive_bayes_reference
+from hw4_p3 import loadfeatures, transformToBooleanFeatures, transformToBooleanColumns, \
+     classifier_accuracy, model_accuracy
+from hw4_model import NaiveBayesModel
+from hw4_precompute import load_season, load_typed_games, make_all_features
+from hw4_cache import load_columns
+from hw4_profile import peak_rss_kb
+
+
+def synthetic_dataset(n,num_features=8,domain_size=2,num_classes=2,seed=0):
+    """Returns n random labeled instances with keys 'Label' and f0,f1,..."""
+    rand = random.Random(seed)
+    feature_keys = ["f%d"%i for i in range(num_features)]
+    dataset = []
+    for i in xrange(n):
+        instance = dict((f,rand.randrange(domain_size)) for f in feature_keys)
+        instance['Label'] = rand.randrange(num_classes)
+        dataset.append(instance)
+    return (feature_keys,dataset)
+
+def timeit(fn,*args):
+    """Returns (result,seconds) for a single call of fn(*args)"""
+    t0 = default_timer()
+    res = fn(*args)
+    return (res,default_timer()-t0)
+
+def bench_train(sizes=(10000,100000,1000000),num_features=8):
+    """Times the single-pass learn_naive_bayes against the original
+    rescanning implementation and checks that they agree."""
+    print "Training, %d binary features"%(num_features,)
+    print "%10s %12s %12s %8s"%("rows","reference","single-pass","speedup")
+    for n in sizes:
+        (feature_keys,dataset) = synthetic_dataset(n,num_features)
+        (ref,tref) = timeit(learn_naive_bayes_reference,'Label',feature_keys,dataset)
+        (res,tnew) = timeit(learn_naive_bayes,'Label',feature_keys,dataset)
+        assert res == ref,"learn_naive_bayes disagrees with the reference"
+        print "%10d %11.3fs %11.3fs %7.1fx"%(n,tref,tnew,tref/tnew)
+
+def bench_infer(sizes=(10000,100000),num_features=8):
+    """Times NaiveBayesModel.predict_proba against one naive_bayes call per
+    instance and checks that the posteriors agree."""
+    print "Inference, %d binary features"%(num_features,)
+    print "%10s %12s %12s %8s"%("rows","per-row","batch","speedup")
+    for n in sizes:
+        (feature_keys,dataset) = synthetic_dataset(n,num_features)
+        (PC,PF) = learn_naive_bayes('Label',feature_keys,dataset)
+        (ref,tref) = timeit(lambda:[naive_bayes(PC,PF,x) for x in dataset])
+        model = NaiveBayesModel.from_dicts(PC,PF)
+        rows = model.encode(dataset)
+        (res,tnew) = timeit(model.predict_proba,rows)
+        for (p,q) in zip(ref,res):
+            assert all(abs(p[c]-q[i]) < 1e-9 for (i,c) in enumerate(model.classes))
+        print "%10d %11.3fs %11.3fs %7.1fx"%(n,tref,tnew,tref/tnew)
+
+def bench_load(fns=("2016 NCAAM Game Results Data.csv","2017 NCAAM Game Results Data.csv",
+                    "2017 NCAAM Game Results Features.csv")):
+    """Times csv.DictReader against the columnar cache of hw4_cache"""
+    def dictreader(fn):
+        with open(fn,"r") as csvfile:
+            return [row for row in csv.DictReader(csvfile)]
+    print "Loading CSV files"
+    print "%40s %12s %12s %8s"%("file","DictReader","cached","speedup")
+    for fn in fns:
+        load_columns(fn)
+        (rows,tref) = timeit(dictreader,fn)
+        (table,tnew) = timeit(load_columns,fn)
+        print "%40s %11.3fs %11.3fs %7.1fx"%(fn,tref,tnew,tref/tnew)
+
+def bench_transform(fn="2017 NCAAM Game Results Features.csv"):
+    """Times transformToBooleanColumns against transformToBooleanFeatures on
+    every row, and checks that they compute the same features"""
+    print "Boolean feature transform of",fn
+    rows = loadfeatures(fn)
+    table = load_columns(fn)
+    (ref,tref) = timeit(lambda:[transformToBooleanFeatures(r) for r in rows])
+    (columns,tnew) = timeit(transformToBooleanColumns,table)
+    names = columns.keys()
+    assert ref == [dict(zip(names,row)) for row in zip(*[columns[f] for f in names])],\
+           "transformToBooleanColumns disagrees with transformToBooleanFeatures"
+    print "%10s %12s %12s %8s"%("rows","per-row","columnar","speedup")
+    print "%10d %11.3fs %11.3fs %7.1fx"%(len(rows),tref,tnew,tref/tnew)
+
+#The benchmark suite.  Each case is a function of the suite options that
+#prepares its inputs and returns (fn,args,rows); only fn(*args) is timed.
+
+def case_learn_discrete(opts):
+    (feature_keys,dataset) = synthetic_dataset(opts['rows'],1,opts['domain_size'])
+    return (learn_discrete,([instance['f0'] for instance in dataset],),opts['rows'])
+
+def case_learn_naive_bayes(opts):
+    (feature_keys,dataset) = synthetic_dataset(opts['rows'],opts['num_features'],opts['domain_size'])
+    return (learn_naive_bayes,('Label',feature_keys,dataset),opts['rows'])
+
+def case_naive_bayes(opts):
+    (feature_keys,dataset) = synthetic_dataset(opts['rows'],opts['num_features'],opts['domain_size'])
+    (PC,PF) = learn_naive_bayes('Label',feature_keys,dataset)
+    return (lambda:[naive_bayes(PC,PF,x) for x in dataset],(),opts['rows'])
+
+def case_predict_proba(opts):
+    (feature_keys,dataset) = synthetic_dataset(opts['rows'],opts['num_features'],opts['domain_size'])
+    model = NaiveBayesModel.learn('Label',feature_keys,dataset)
+    return (model.predict_proba,(model.encode(dataset),),opts['rows'])
+
+def case_classifier_accuracy(opts):
+    (feature_keys,dataset) = synthetic_dataset(opts['rows'],opts['num_features'],opts['domain_size'])
+    (PC,PF) = learn_naive_bayes('Label',feature_keys,dataset)
+    classifier = lambda x:naive_bayes_log(PC,PF,x)[1]
+    return (classifier_accuracy,(classifier,0.5,dataset,'Label'),opts['rows'])
+
+def case_model_accuracy(opts):
+    (feature_keys,dataset) = synthetic_dataset(opts['rows'],opts['num_features'],opts['domain_size'])
+    model = NaiveBayesModel.learn('Label',feature_keys,dataset)
+    rows = model.encode(dataset)
+    return (model_accuracy,(model,0.5,rows,[x['Label'] for x in dataset]),opts['rows'])
+
+def case_make_all_features(opts):
+    seasons = [load_season(fn)['uniquegames'] for fn in opts['games_fns']]
+    return (lambda:map(make_all_features,seasons),(),sum(map(len,seasons)))
+
+def load_games_case(fn):
+    """Times load_typed_games, the uncached loader behind load_season"""
+    (teams,games) = load_typed_games(fn)
+    return (load_typed_games,(fn,),len(games))
+
+def case_load_games_2016(opts):
+    return load_games_case("2016 NCAAM Game Results Data.csv")
+
+def case_load_games_2017(opts):
+    return load_games_case("2017 NCAAM Game Results Data.csv")
+
+def case_loadfeatures(opts):
+    return (loadfeatures,(opts['features_fn'],),len(loadfeatures(opts['features_fn'])))
+
+def case_load_columns(opts):
+    table = load_columns(opts['features_fn'])
+    return (load_columns,(opts['features_fn'],),table['nrows'])
+
+suite = [case_learn_discrete,case_learn_naive_bayes,case_naive_bayes,case_predict_proba,
+         case_classifier_accuracy,case_model_accuracy,case_make_all_features,case_load_games_2016,
+         case_load_games_2017,case_loadfeatures,case_load_columns]
+
+#the shortest time of one measurement; quick cases are called several times
+#per measurement to reach it
+min_measurement_seconds = 0.2
+
+def run_case(job):
+    """Runs one case in the current process and measures it.  fn(*args) is
+    called once to warm up, and then measured opts['repeat'] times, each
+    measurement timing enough calls (loops) to last min_measurement_seconds.
+    seconds is the fastest measurement and median_seconds the median, per
+    call.  Meant to run in a fresh worker process, so that the peak memory
+    is the case's own: peak_rss_increase_kb is the growth of the peak from
+    before the case prepared its inputs, so it counts the inputs as well as
+    the calls."""
+    (case,opts) = job
+    before = peak_rss_kb()
+    (fn,args,rows) = case(opts)
+    warmup = timeit(fn,*args)[1]
+    loops = 1 if warmup >= min_measurement_seconds else int(min_measurement_seconds/max(warmup,1e-6))+1
+    times = []
+    for i in range(opts['repeat']):
+        t0 = default_timer()
+        for j in xrange(loops):
+            fn(*args)
+        times.append((default_timer()-t0)/loops)
+    times.sort()
+    seconds = times[0]
+    return {'name':case.__name__[len("case_"):],'rows':rows,'repeat':len(times),'loops':loops,
+            'seconds':seconds,'median_seconds':times[len(times)//2],
+            'rows_per_second':rows/seconds if seconds > 0 else None,
+            'peak_rss_kb':peak_rss_kb(),'peak_rss_increase_kb':peak_rss_kb()-before}
+
+def run_suite(opts,cases=suite):
+    """Runs each case of the suite in its own process.  Returns the results
+    with the options and the environment they were measured in."""
+    results = []
+    for case in cases:
+        pool = multiprocessing.Pool(1)
+        try:
+            results.append(pool.apply(run_case,((case,opts),)))
+        finally:
+            pool.terminate()
+    try:
+        commit = subprocess.check_output(["git","rev-parse","HEAD"],stderr=subprocess.STDOUT).strip()
+    except (OSError,subprocess.CalledProcessError):
+        commit = None
+    return {'commit':commit,'time':time.strftime("%Y-%m-%d %H:%M:%S"),
+            'python':sys.version.split()[0],'options':opts,'results':results}
+
+def print_results(report,baseline=None):
+    """Prints a report of run_suite, with the speedups of the fastest times
+    relative to a baseline report if one is given"""
+    before = dict((r['name'],r) for r in baseline['results']) if baseline != None else {}
+    print "%-22s %10s %10s %10s %14s %12s %8s"%("case","rows","seconds","median","rows/second","peak MB","speedup")
+    for r in report['results']:
+        speedup = ""
+        if r['name'] in before and r['seconds'] > 0:
+            speedup = "%7.2fx"%(before[r['name']]['seconds']/r['seconds'],)
+        print "%-22s %10d %10.4f %10.4f %14.0f %12.1f %8s"%(r['name'],r['rows'],r['seconds'],
+                                                           r['median_seconds'],r['rows_per_second'] or 0,
+                                                           r['peak_rss_kb']/1024.,speedup)
+
+if __name__=="__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the training, inference, precompute and evaluation hot paths")
+    parser.add_argument("--rows",type=int,default=100000,help="rows of the synthetic datasets")
+    parser.add_argument("--features",type=int,default=8,help="features of the synthetic datasets")
+    parser.add_argument("--domain",type=int,default=2,help="domain size of the synthetic features")
+    parser.add_argument("--games",nargs="+",default=["2016 NCAAM Game Results Data.csv","2017 NCAAM Game Results Data.csv"],
+                        help="games files for make_all_features")
+    parser.add_argument("--features-file",default="2017 NCAAM Game Results Features.csv",help="features file for loading")
+    parser.add_argument("--repeat",type=int,default=5,help="timed calls of each case, after one warm-up call")
+    parser.add_argument("--output",default="benchmark_results.json",help="where to write the JSON results")
+    parser.add_argument("--baseline",help="JSON results of an earlier run to compare with")
+    parser.add_argument("--compare",action="store_true",help="also compare the fast paths with the originals")
+    args = parser.parse_args()
+
+    opts = {'rows':args.rows,'num_features':args.features,'domain_size':args.domain,
+            'games_fns':args.games,'features_fn':args.features_file,'repeat':args.repeat}
+    report = run_suite(opts)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline,"r") as f:
+            baseline = json.load(f)
+    print_results(report,baseline)
+    with open(args.output,"w") as f:
+        json.dump(report,f,indent=2)
+    print "Results saved to",args.output
+    if args.compare:
+        bench_train()
+        bench_infer()
+        bench_load()
+        bench_transform()
@@ -0,0 +1,111 @@
+import multiprocessing
+import random
+import time
+
+from hw4_p3 import load_dataset, model_accuracy, accuracy_stats
+from hw4_model import NaiveBayesCounts
+from hw4_cache import column_values
+
+
+def kfold_splits(n,k=10,seed=0):
+    """Randomly splits the instances 0,...,n-1 into k folds.  Returns a list
+    of k (train,test) pairs of index lists.  Raises ValueError if k > n,
+    which would leave a fold empty."""
+    if k > n:
+        raise ValueError("%d folds need at least as many instances, there are %d"%(k,n))
+    order = range(n)
+    random.Random(seed).shuffle(order)
+    folds = [sorted(order[i::k]) for i in range(k)]
+    return [(sorted(set(order)-set(test)),test) for test in folds]
+
+def walk_forward_splits(dates,k=5):
+    """Splits the instances into k+1 consecutive blocks of about the same
+    size by date, never separating games played on the same date, and never
+    leaving a block empty.  Returns k (train,test) pairs where the i'th test
+    set is block i+1 and its training set is all the blocks before it.
+    Raises ValueError if there are fewer than k+1 distinct dates.
+
+    dates[i] is the date of instance i, as a string mm/dd/yyyy."""
+    n = len(dates)
+    parsed = [time.strptime(d,"%m/%d/%Y") for d in dates]
+    order = sorted(range(n),key=parsed.__getitem__)
+    groups = []
+    start = 0
+    while start < n:
+        end = start
+        while end < n and parsed[order[end]] == parsed[order[start]]:
+            end += 1
+        groups.append((start,end))
+        start = end
+    if len(groups) < k+1:
+        raise ValueError("%d walk-forward blocks need at least as many dates, there are %d"%(k+1,len(groups)))
+    blocks = [[] for b in range(k+1)]
+    b = -1
+    for (g,(start,end)) in enumerate(groups):
+        #go by size, but move on at most one block per date, and early
+        #enough that every remaining block gets a date
+        b = max(min(max(b,start*(k+1)//n),b+1),k+1-(len(groups)-g))
+        blocks[b].extend(order[start:end])
+    return [(sorted(sum(blocks[:i+1],[])),sorted(blocks[i+1])) for i in range(k)]
+
+def fold_accuracy(job):
+    """Computes the model_accuracy stats of one fold, given as a tuple
+    (model,p_threshold,rows,labels) where model is a NaiveBayesModel, rows
+    are the encoded test instances and labels their team_won values"""
+    return model_accuracy(*job)
+
+def cross_validate(prediction_variables,splits,virtual_counts=1,p_threshold=0.5,processes=None,fn=None):
+    """Cross-validates a Naive Bayes model for team_won on the given
+    prediction variables over the given (train,test) splits of the
+    transformed features of the file fn (features_fn by default), e.g. from
+    kfold_splits or walk_forward_splits.
+
+    The counts of the whole dataset are computed once; each fold's model
+    is obtained by retracting the instances outside its training set.  All
+    the models keep the class and feature domains of the whole dataset, so
+    a test set may hold values its training set lacks.  The
+    folds are evaluated in a process pool (processes=1 evaluates them in
+    this process).
+
+    Returns a dictionary with elements:
+    - folds: the model_accuracy stats of each fold
+    - total: the stats of all the folds' predictions taken together
+    - mean_accuracy: the average accuracy over the folds
+    """
+    dataset = load_dataset(fn)
+    transformedfeatures = dataset['transformedfeatures']
+    labels = dataset['columns']["team_won"]
+    everything = NaiveBayesCounts("team_won",prediction_variables,virtual_counts,virtual_counts,
+                                  set(labels),dict((f,set(dataset['columns'][f])) for f in prediction_variables))
+    everything.add(transformedfeatures)
+    jobs = []
+    for (train,test) in splits:
+        counts = everything.copy()
+        excluded = set(range(len(transformedfeatures))) - set(train)
+        counts.retract(transformedfeatures[i] for i in excluded)
+        model = counts.model()
+        columns = dict((f,[dataset['columns'][f][i] for i in test]) for f in model.features)
+        jobs.append((model,p_threshold,model.encode_columns(columns),[labels[i] for i in test]))
+    if processes == 1:
+        folds = map(fold_accuracy,jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            folds = pool.map(fold_accuracy,jobs)
+        finally:
+            pool.terminate()
+    total = accuracy_stats(*[sum(s[k] for s in folds) for k in ['tp','fp','tn','fn']])
+    return {'folds':folds,'total':total,
+            'mean_accuracy':sum(s['accuracy'] for s in folds)/len(folds)}
+
+if __name__=="__main__":
+    dataset = load_dataset()
+    prediction_variables = dataset['non_name_variables']
+    for (name,splits) in [("10-fold",kfold_splits(len(dataset['transformedfeatures']),10)),
+                          ("walk-forward",walk_forward_splits(column_values(dataset['table'],"Date"),5))]:
+        res = cross_validate(prediction_variables,splits,p_threshold=0.47)
+        print name,"cross-validation:"
+        for (i,stats) in enumerate(res['folds']):
+            print "  fold %d: accuracy %f, precision %f, recall %f"%(i,stats['accuracy'],stats['precision'],stats['recall'])
+        print "  mean accuracy:",res['mean_accuracy']
+        print "  total accuracy:",res['total']['accuracy']
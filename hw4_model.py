@@ -0,0 +1,476 @@
+from __future__ import with_statement
+from array import array
+from collections import defaultdict
+import json
+import math
+import operator
+import struct
+import sys
+
+from hw4_p1 import safe_log, posterior_batch, posterior_batch_targets
+from hw4_p2 import learn_naive_bayes, learn_naive_bayes_targets, naive_bayes_from_counts
+
+
+#NaiveBayesModel files start with the magic string and then the version and
+#the length of the JSON header as two little-endian 32-bit integers
+model_file_magic = "NBMODEL\0"
+model_file_version = 1
+
+def from_json_value(v):
+    """Converts a string read from JSON back to a byte string"""
+    return v.encode('utf-8') if isinstance(v,unicode) else v
+
+class NaiveBayesModel(object):
+    """A Naive Bayes model with class and feature values interned to integer
+    codes and the probability tables stored in contiguous arrays.
+
+    - classes: list of class values; class i has code i
+    - features: list of feature names; feature j is column j of a row
+    - values: values[j] is the list of values of feature j; value code k
+      stands for values[j][k]
+    - prior: array of P(C=classes[i])
+    - tables: tables[j] is an array of P(Fj=values[j][k]|C=classes[i]),
+      stored class-major at index i*len(values[j])+k
+
+    - metadata: a dictionary of JSON-compatible information saved with the
+      model, such as the virtual counts and the decision threshold
+
+    Instances are scored as rows of value codes (see encode).
+    """
+
+    def __init__(self,classes,features,values,prior,tables,metadata=None):
+        self.metadata = dict(metadata) if metadata != None else dict()
+        self.classes = list(classes)
+        self.features = list(features)
+        self.values = [list(vs) for vs in values]
+        self.prior = array('d',prior)
+        self.tables = [array('d',t) for t in tables]
+        self.class_codes = dict((c,i) for (i,c) in enumerate(self.classes))
+        self.value_codes = [dict((v,k) for (k,v) in enumerate(vs)) for vs in self.values]
+        self.log_prior = array('d',map(safe_log,self.prior))
+        self.log_tables = [array('d',map(safe_log,t)) for t in self.tables]
+
+    @classmethod
+    def from_dicts(cls,class_probabilities,feature_probabilities,feature_keys=None):
+        """Builds a model from the (PC,PF) dictionaries used by naive_bayes and
+        learn_naive_bayes."""
+        if feature_keys == None:
+            feature_keys = sorted(feature_probabilities.keys())
+        classes = sorted(class_probabilities.keys())
+        values = []
+        tables = []
+        for f in feature_keys:
+            PFf = feature_probabilities[f]
+            vs = sorted(set(v for c in classes for v in PFf[c]))
+            values.append(vs)
+            tables.append([PFf[c].get(v,0.) for c in classes for v in vs])
+        return cls(classes,feature_keys,values,
+                   [class_probabilities[c] for c in classes],tables)
+
+    @classmethod
+    def learn(cls,class_key,feature_keys,dataset,
+              class_prior_count=1,feature_posterior_count=1):
+        """Trains a model with learn_naive_bayes"""
+        (PC,PF) = learn_naive_bayes(class_key,feature_keys,dataset,
+                                    class_prior_count,feature_posterior_count)
+        return cls.from_dicts(PC,PF,feature_keys)
+
+    def to_dicts(self):
+        """Returns the model as a (PC,PF) pair of dictionaries"""
+        PC = dict(zip(self.classes,self.prior))
+        PF = dict()
+        for (f,vs,t) in zip(self.features,self.values,self.tables):
+            n = len(vs)
+            PF[f] = dict((c,dict(zip(vs,t[i*n:(i+1)*n])))
+                         for (i,c) in enumerate(self.classes))
+        return (PC,PF)
+
+    def save(self,fn):
+        """Writes the model to a binary file: a header, the vocabulary and
+        metadata as JSON, and then all the probabilities as little-endian
+        doubles, 8-byte aligned (see model_file_magic)"""
+        header = json.dumps({'classes':self.classes,'features':self.features,
+                             'values':self.values,'metadata':self.metadata})
+        header += " "*(-(len(model_file_magic)+8+len(header)) % 8)
+        data = array('d',self.prior)
+        for t in self.tables:
+            data.extend(t)
+        if sys.byteorder != 'little':
+            data.byteswap()
+        with open(fn,"wb") as f:
+            f.write(model_file_magic)
+            f.write(struct.pack("<II",model_file_version,len(header)))
+            f.write(header)
+            data.tofile(f)
+
+    @classmethod
+    def load(cls,fn):
+        """Reads a model written by save.  The header is parsed from its JSON
+        and the tables are read straight into one array of doubles."""
+        with open(fn,"rb") as f:
+            contents = f.read()
+        start = len(model_file_magic)
+        if contents[:start] != model_file_magic:
+            raise ValueError("%s is not a naive Bayes model file"%(fn,))
+        (version,length) = struct.unpack_from("<II",contents,start)
+        if version != model_file_version:
+            raise ValueError("%s has unsupported model file version %d"%(fn,version))
+        start += 8
+        header = json.loads(contents[start:start+length])
+        start += length
+        data = array('d')
+        data.fromstring(contents[start:])
+        if sys.byteorder != 'little':
+            data.byteswap()
+        classes = map(from_json_value,header['classes'])
+        values = [map(from_json_value,vs) for vs in header['values']]
+        prior = data[:len(classes)]
+        tables = []
+        offset = len(classes)
+        for vs in values:
+            size = len(classes)*len(vs)
+            tables.append(data[offset:offset+size])
+            offset += size
+        return cls(classes,map(from_json_value,header['features']),values,prior,tables,
+                   header['metadata'])
+
+    def encode(self,instances):
+        """Encodes a list of instance dictionaries as rows of value codes"""
+        columns = zip(self.features,self.value_codes)
+        return [[codes[instance[f]] for (f,codes) in columns] for instance in instances]
+
+    def encode_columns(self,columns):
+        """Encodes a dataset given as columns, columns[f] holding the value of
+        feature f of every instance (e.g. from transformToBooleanColumns), as
+        rows of value codes"""
+        if len(self.features) == 0:
+            return [()]*len(columns.itervalues().next())
+        return zip(*[map(codes.__getitem__,columns[f])
+                     for (f,codes) in zip(self.features,self.value_codes)])
+
+    def log_columns(self):
+        """Returns the log tables split per class, as posterior_batch takes
+        them: log_columns[i][j][k] = log P(Fj=values[j][k]|C=classes[i])"""
+        log_columns = []
+        for i in range(len(self.classes)):
+            log_columns.append([t[i*len(vs):(i+1)*len(vs)]
+                                for (vs,t) in zip(self.values,self.log_tables)])
+        return log_columns
+
+    def predict_proba(self,rows):
+        """Returns one posterior per encoded row, each a tuple of
+        P(C=c|F=row) in the order of self.classes."""
+        return posterior_batch(self.log_prior,self.log_columns(),rows)
+
+    def predict(self,rows):
+        """Returns the most probable class value of each encoded row"""
+        classes = self.classes
+        return [classes[max(xrange(len(p)),key=p.__getitem__)] for p in self.predict_proba(rows)]
+
+
+class MultiTargetModel(object):
+    """One NaiveBayesModel per target (class key), all over the same features
+    and values, so an instance is encoded once and its rows are scored for
+    every target together.
+
+    - targets: list of class keys
+    - models: models[t] is the NaiveBayesModel of targets[t]
+    """
+
+    def __init__(self,targets,models):
+        self.targets = list(targets)
+        self.models = list(models)
+        for m in self.models[1:]:
+            if m.features != self.models[0].features or m.values != self.models[0].values:
+                raise ValueError("the models of a MultiTargetModel must share their features and values")
+
+    @classmethod
+    def learn(cls,class_keys,feature_keys,dataset,
+              class_prior_count=1,feature_posterior_count=1):
+        """Trains a model per class key with learn_naive_bayes_targets, in one
+        pass over the dataset"""
+        learned = learn_naive_bayes_targets(class_keys,feature_keys,dataset,
+                                            class_prior_count,feature_posterior_count)
+        return cls(class_keys,[NaiveBayesModel.from_dicts(learned[k][0],learned[k][1],feature_keys)
+                               for k in class_keys])
+
+    def model(self,target):
+        """Returns the NaiveBayesModel of a target"""
+        return self.models[self.targets.index(target)]
+
+    def encode(self,instances):
+        """Encodes a list of instance dictionaries as rows of value codes,
+        shared by all the targets"""
+        return self.models[0].encode(instances)
+
+    def predict_proba(self,rows):
+        """Returns a dictionary mapping each target to the posteriors of the
+        encoded rows, as its model's predict_proba would"""
+        posteriors = posterior_batch_targets([(m.log_prior,m.log_columns()) for m in self.models],rows)
+        return dict(zip(self.targets,posteriors))
+
+    def predict(self,rows):
+        """Returns a dictionary mapping each target to the most probable class
+        value of each encoded row"""
+        res = dict()
+        for (target,posteriors) in self.predict_proba(rows).iteritems():
+            classes = self.model(target).classes
+            res[target] = [classes[max(xrange(len(p)),key=p.__getitem__)] for p in posteriors]
+        return res
+
+
+def count_table():
+    """An empty table of counts.  A named function rather than a lambda so
+    that NaiveBayesCounts can be pickled."""
+    return defaultdict(int)
+
+class NaiveBayesCounts(object):
+    """The sufficient statistics of a Naive Bayes model: the number of
+    instances of each class and of each (feature,class,value) combination.
+
+    Instances can be added or retracted at any time, at a cost proportional
+    to the number of instances.  The smoothed distributions are recomputed
+    lazily when they are asked for, with the same virtual-count formula as
+    learn_discrete; they equal what learn_naive_bayes returns on the current
+    instances with the same virtual counts.  Like learn_naive_bayes, the
+    feature posteriors are smoothed with one virtual count, whatever
+    feature_posterior_count is.
+    """
+
+    def __init__(self,class_key,feature_keys,
+                 class_prior_count=1,feature_posterior_count=1,
+                 class_domain=None,feature_domains=None):
+        self.class_key = class_key
+        self.feature_keys = list(feature_keys)
+        self.class_prior_count = class_prior_count
+        self.feature_posterior_count = feature_posterior_count
+        self.class_domain = class_domain
+        self.feature_domains = feature_domains
+        self.class_counts = defaultdict(int)
+        self.feature_counts = dict((f,defaultdict(count_table)) for f in self.feature_keys)
+        self._distributions = None
+        self._model = None
+
+    def update(self,instances,weight=1):
+        """Adds each instance weight times to the counts.  The changes of the
+        whole batch are totalled and checked before any count is touched, so
+        a batch that fails (a missing key, or retracting instances that were
+        never added) leaves the counts as they were."""
+        class_key = self.class_key
+        class_deltas = defaultdict(int)
+        feature_deltas = defaultdict(int)
+        for instance in instances:
+            c = instance[class_key]
+            class_deltas[c] += weight
+            for f in self.feature_keys:
+                feature_deltas[(f,c,instance[f])] += weight
+        for (c,n) in class_deltas.iteritems():
+            if self.class_counts.get(c,0)+n < 0:
+                raise ValueError("cannot retract an instance of class %r that was never added"%(c,))
+        for ((f,c,v),n) in feature_deltas.iteritems():
+            if self.feature_counts[f].get(c,{}).get(v,0)+n < 0:
+                raise ValueError("cannot retract value %r of feature %r that was never added"%(v,f))
+        self._distributions = None
+        self._model = None
+        for (c,n) in class_deltas.iteritems():
+            self.class_counts[c] += n
+        for ((f,c,v),n) in feature_deltas.iteritems():
+            self.feature_counts[f][c][v] += n
+
+    def add(self,instances):
+        """Adds labeled instances to the counts"""
+        self.update(instances,1)
+
+    def retract(self,instances):
+        """Removes previously added labeled instances from the counts"""
+        self.update(instances,-1)
+
+    def copy(self):
+        """Returns an independent copy of these counts"""
+        res = NaiveBayesCounts(self.class_key,self.feature_keys,
+                               self.class_prior_count,self.feature_posterior_count,
+                               self.class_domain,self.feature_domains)
+        res.class_counts.update(self.class_counts)
+        for (f,Cf) in self.feature_counts.iteritems():
+            for (c,Cfc) in Cf.iteritems():
+                res.feature_counts[f][c].update(Cfc)
+        return res
+
+    def merge(self,other):
+        """Adds the counts of another NaiveBayesCounts over the same class and
+        features, e.g. counted on a different part of the dataset"""
+        if other.class_key != self.class_key or sorted(other.feature_keys) != sorted(self.feature_keys):
+            raise ValueError("cannot merge counts of different classes or features")
+        self._distributions = None
+        self._model = None
+        for (c,n) in other.class_counts.iteritems():
+            self.class_counts[c] += n
+        for (f,Cf) in other.feature_counts.iteritems():
+            for (c,Cfc) in Cf.iteritems():
+                for (v,n) in Cfc.iteritems():
+                    self.feature_counts[f][c][v] += n
+
+    def to_json(self):
+        """Returns the counts and settings as a JSON-compatible dictionary.
+        Tables are stored as lists of [key,...,count] rows so that keys keep
+        their types."""
+        feature_domains = None
+        if self.feature_domains != None:
+            feature_domains = [[f,list(vs)] for (f,vs) in self.feature_domains.iteritems()]
+        return {'class_key':self.class_key,'feature_keys':self.feature_keys,
+                'class_prior_count':self.class_prior_count,
+                'feature_posterior_count':self.feature_posterior_count,
+                'class_domain':list(self.class_domain) if self.class_domain != None else None,
+                'feature_domains':feature_domains,
+                'class_counts':[[c,n] for (c,n) in self.class_counts.iteritems()],
+                'feature_counts':[[f,c,v,n] for (f,Cf) in self.feature_counts.iteritems()
+                                  for (c,Cfc) in Cf.iteritems() for (v,n) in Cfc.iteritems()]}
+
+    @classmethod
+    def from_json(cls,data):
+        """Rebuilds counts from the dictionary returned by to_json"""
+        feature_domains = None
+        if data['feature_domains'] != None:
+            feature_domains = dict((f,set(vs)) for (f,vs) in data['feature_domains'])
+        class_domain = set(data['class_domain']) if data['class_domain'] != None else None
+        res = cls(data['class_key'],data['feature_keys'],
+                  data['class_prior_count'],data['feature_posterior_count'],
+                  class_domain,feature_domains)
+        for (c,n) in data['class_counts']:
+            res.class_counts[c] += n
+        for (f,c,v,n) in data['feature_counts']:
+            res.feature_counts[f][c][v] += n
+        return res
+
+    def save(self,fn):
+        """Writes the counts to a JSON file"""
+        with open(fn,"w") as f:
+            json.dump(self.to_json(),f)
+
+    @classmethod
+    def load(cls,fn):
+        """Reads counts written by save"""
+        with open(fn,"r") as f:
+            return cls.from_json(json.load(f))
+
+    def distributions(self):
+        """Returns the smoothed (PC,PF) pair for the current counts"""
+        if self._distributions == None:
+            feature_domains = dict(self.feature_domains) if self.feature_domains != None else None
+            self._distributions = naive_bayes_from_counts(self.class_counts,self.feature_counts,
+                                                          self.class_prior_count,1,
+                                                          self.class_domain,feature_domains)
+        return self._distributions
+
+    def model(self):
+        """Returns the NaiveBayesModel for the current counts"""
+        if self._model == None:
+            (PC,PF) = self.distributions()
+            self._model = NaiveBayesModel.from_dicts(PC,PF,self.feature_keys)
+        return self._model
+
+
+class SparseNaiveBayesModel(object):
+    """A Naive Bayes model over many binary indicator features, for instances
+    given as lists of the ids of their active (value 1) features, such as
+    one-hot team identities.
+
+    Every indicator has the domain {0,1}.  The log probability of class i
+    given an instance is stored as a per-class baseline, log P(C=ci) plus
+    log P(Fj=0|C=ci) for all j, plus one correction
+    log P(Fj=1|C=ci) - log P(Fj=0|C=ci) per active feature j.  Scoring an
+    instance therefore only touches its active features.
+
+    A feature j with P(Fj=0|C=ci) = 0 has no such correction.  It is one of
+    the required features of class i instead: its baseline leaves out the
+    log P(Fj=0|C=ci) term, its correction is log P(Fj=1|C=ci) (-inf if that
+    is 0 too), and an instance without all of them has probability 0.
+
+    - classes: list of class values; class i has code i
+    - features: list of feature names; feature j has id j
+    - log_baseline: array of the baselines of the classes
+    - log_active: log_active[i] is the array of corrections of class i
+    - required: required[i] is the set of required feature ids of class i
+      (none by default)
+    """
+
+    def __init__(self,classes,features,log_baseline,log_active,required=None):
+        self.classes = list(classes)
+        self.features = list(features)
+        self.class_codes = dict((c,i) for (i,c) in enumerate(self.classes))
+        self.feature_codes = dict((f,j) for (j,f) in enumerate(self.features))
+        self.log_baseline = array('d',log_baseline)
+        self.log_active = [array('d',a) for a in log_active]
+        if required == None:
+            required = [()]*len(self.classes)
+        self.required = [frozenset(r) for r in required]
+
+    @classmethod
+    def learn(cls,labels,instances,features,
+              class_prior_count=1,feature_posterior_count=1):
+        """Trains a model from the class value labels[k] and the list of active
+        feature ids instances[k] of each instance k, where feature j is named
+        features[j] and the ids of an instance are distinct.  The estimates
+        use the virtual counts of learn_discrete, so with
+        feature_posterior_count 1 they are those of learn_naive_bayes with the
+        domain {0,1} for every feature."""
+        classes = sorted(set(labels))
+        class_codes = dict((c,i) for (i,c) in enumerate(classes))
+        num_features = len(features)
+        class_counts = [0]*len(classes)
+        active_counts = [array('l',[0])*num_features for c in classes]
+        for (c,active) in zip(labels,instances):
+            i = class_codes[c]
+            class_counts[i] += 1
+            counts = active_counts[i]
+            for j in active:
+                counts[j] += 1
+        total = len(labels)
+        log_baseline = []
+        log_active = []
+        required = []
+        for (n,counts) in zip(class_counts,active_counts):
+            prior = float(n + class_prior_count) / (len(classes)*class_prior_count + total)
+            denominator = float(2*feature_posterior_count + n)
+            log_p1 = [safe_log((k + feature_posterior_count) / denominator) for k in counts]
+            log_p0 = [safe_log((n - k + feature_posterior_count) / denominator) for k in counts]
+            #with no virtual counts, a feature every instance of the class has
+            #is required: leave its -inf out of the baseline
+            required.append([j for (j,l) in enumerate(log_p0) if l == float('-inf')])
+            for j in required[-1]:
+                log_p0[j] = 0.
+            log_baseline.append(safe_log(prior) + math.fsum(log_p0))
+            log_active.append(map(operator.sub,log_p1,log_p0))
+        return cls(classes,features,log_baseline,log_active,required)
+
+    def encode(self,instances):
+        """Converts instances given as lists of active feature names to lists
+        of feature ids"""
+        codes = self.feature_codes
+        return [[codes[f] for f in active] for active in instances]
+
+    def predict_proba(self,instances):
+        """Returns one posterior per instance (a list of active feature ids),
+        each a tuple of P(C=c|F=instance) in the order of self.classes"""
+        required = [(i,r) for (i,r) in enumerate(self.required) if r]
+        res = []
+        for active in instances:
+            scores = [b + sum(map(a.__getitem__,active))
+                      for (b,a) in zip(self.log_baseline,self.log_active)]
+            if required:
+                present = set(active)
+                for (i,r) in required:
+                    if not r <= present:
+                        scores[i] = float('-inf')
+            m = max(scores)
+            if m == float('-inf'):
+                raise ZeroDivisionError("every class has zero probability")
+            e = [math.exp(s-m) for s in scores]
+            total = sum(e)
+            res.append(tuple(v/total for v in e))
+        return res
+
+    def predict(self,instances):
+        """Returns the most probable class value of each instance"""
+        classes = self.classes
+        return [classes[max(xrange(len(p)),key=p.__getitem__)] for p in self.predict_proba(instances)]
@@ -1,4 +1,10 @@
-from collections import defaultdict
+from array import array
+from collections import defaultdict, OrderedDict
+import itertools
+import math
+import operator
+
+import hw4_profile
 
 
 def marginalize(probabilities,index):
@@ -15,11 +21,21 @@ def marginalize(probabilities,index):
     return res
 
 def marginalize_multiple(probabilities,indices):
-    """Safely marginalizes multiple indices"""
-    pmarg = probabilities
-    for index in reversed(sorted(indices)):
-        pmarg = marginalize(pmarg,index)
-    return pmarg
+    """Safely marginalizes multiple indices, in a single pass over the table"""
+    indices = set(indices)
+    if len(indices) == 1:
+        return marginalize(probabilities,indices.pop())
+    kept = [i for i in range(len(next(iter(probabilities),()))) if i not in indices]
+    if len(kept) > 1:
+        newkey = operator.itemgetter(*kept)
+    elif len(kept) == 1:
+        newkey = lambda k:(k[kept[0]],)
+    else:
+        newkey = lambda k:()
+    res = defaultdict(float)
+    for k,v in probabilities.iteritems():
+        res[newkey(k)] += v
+    return res
 
 def normalize(probabilities):
     """Given an unnormalized distribution, returns a normalized copy that
@@ -41,6 +57,128 @@ def condition(probabilities,index,value):
             res[k[:index]+k[index+1:]] = v
     return normalize(res)
 
+class Factor(object):
+    """A dense probability table over named variables, such as
+    P(X1,...,Xn), stored in a flat array in row-major order.
+
+    - names: the variable names, one per axis
+    - domains: domains[i] is the sorted list of values of variable names[i]
+    - data, offset, strides: the value of the assignment with value indices
+      (j1,...,jn) is data[offset + j1*strides[0] + ... + jn*strides[n-1]]
+
+    Unlike the dictionary functions above, which only touch the entries a
+    table has, a factor holds every cell of the product of the domains, so
+    it suits dense tables that are queried repeatedly.
+
+    Conditioning returns a view that shares data with the original table.
+    Factors are never modified, so the results of marginalize and condition
+    are kept in a small LRU cache and repeated queries cost nothing.
+    """
+
+    def __init__(self,names,domains,data,offset=0,strides=None,cache_size=128):
+        self.names = list(names)
+        self.domains = [list(d) for d in domains]
+        self.data = data
+        self.offset = offset
+        if strides == None:
+            strides = []
+            size = 1
+            for d in reversed(self.domains):
+                strides.insert(0,size)
+                size *= len(d)
+        self.strides = list(strides)
+        self.indices = [dict((v,j) for (j,v) in enumerate(d)) for d in self.domains]
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+
+    @classmethod
+    def from_dict(cls,probabilities,names=None):
+        """Builds a factor from a probability table given as a map from tuples
+        of variable assignments to values; missing assignments are 0.  The
+        variables are named 0,1,... unless names are given."""
+        n = len(next(iter(probabilities),()))
+        if names == None:
+            names = range(n)
+        domains = [sorted(set(k[i] for k in probabilities)) for i in range(n)]
+        res = cls(names,domains,array('d'))
+        res.data = array('d',[0.])*reduce(operator.mul,[len(d) for d in domains],1)
+        for k,v in probabilities.iteritems():
+            res.data[res.position(k)] = v
+        return res
+
+    def position(self,assignment):
+        """The index in data of a tuple of values, one per variable"""
+        return self.offset + sum(s*index[v] for (s,index,v) in zip(self.strides,self.indices,assignment))
+
+    def positions(self,axes=None):
+        """The indices in data of every assignment, in row-major order of the
+        given axes (all the axes in order by default)"""
+        if axes == None:
+            axes = range(len(self.names))
+        res = [self.offset]
+        for i in axes:
+            steps = [j*self.strides[i] for j in range(len(self.domains[i]))]
+            res = [p+s for p in res for s in steps]
+        return res
+
+    def values(self):
+        """All the values of the table, in row-major order"""
+        return map(self.data.__getitem__,self.positions())
+
+    def to_dict(self):
+        """Returns the table as a map from tuples of variable assignments to
+        values, including the zero entries"""
+        return dict(zip(itertools.product(*self.domains),self.values()))
+
+    def cached(self,key,compute):
+        """Returns the cached result of a query, computing it if needed"""
+        if key in self.cache:
+            res = self.cache.pop(key)
+        else:
+            res = compute()
+            if len(self.cache) >= self.cache_size:
+                self.cache.popitem(last=False)
+        self.cache[key] = res
+        return res
+
+    def marginalize(self,names):
+        """Sums out all the given variables in one pass over the table"""
+        names = frozenset(names)
+        return self.cached(('marginalize',names),lambda:self.compute_marginal(names))
+
+    def compute_marginal(self,names):
+        """Computes marginalize(names), bypassing the cache"""
+        kept = [i for (i,name) in enumerate(self.names) if name not in names]
+        summed = [i for (i,name) in enumerate(self.names) if name in names]
+        #with the summed axes innermost, each kept assignment is a run of
+        #consecutive values
+        values = map(self.data.__getitem__,self.positions(kept+summed))
+        run = reduce(operator.mul,[len(self.domains[i]) for i in summed],1)
+        data = array('d',[sum(values[k:k+run]) for k in xrange(0,len(values),run)])
+        return Factor([self.names[i] for i in kept],[self.domains[i] for i in kept],data)
+
+    def condition(self,name,value):
+        """Returns the slice of the table where variable name has the given
+        value, without copying: P(X1,...,Xi-1,Xi+1,...,Xn,Xi=v).  Normalize
+        it to get P(X1,...,Xi-1,Xi+1,...,Xn|Xi=v)."""
+        return self.cached(('condition',name,value),lambda:self.compute_slice(name,value))
+
+    def compute_slice(self,name,value):
+        """Computes condition(name,value), bypassing the cache"""
+        i = self.names.index(name)
+        rest = lambda l:l[:i]+l[i+1:]
+        return Factor(rest(self.names),rest(self.domains),self.data,
+                      self.offset+self.strides[i]*self.indices[i][value],rest(self.strides))
+
+    def total(self):
+        """The sum of all the values of the table"""
+        return math.fsum(self.values())
+
+    def normalize(self):
+        """Returns a normalized copy that sums to 1"""
+        vtotal = self.total()
+        return Factor(self.names,self.domains,array('d',[v/vtotal for v in self.values()]))
+
 def naive_bayes(class_probabilities,feature_probabilities,instance):
     """Naive Bayes inference. Given class probabilities P(C) and feature
     conditional probabilities P(Fk|C), compute P(C|F=finstance), where
@@ -65,6 +203,85 @@ def naive_bayes(class_probabilities,feature_probabilities,instance):
 
     return normalize(a)
 
+def safe_log(p):
+    """Natural logarithm of a probability, with log(0) = -inf"""
+    return math.log(p) if p > 0 else float('-inf')
+
+def log_normalize(log_probabilities):
+    """Given an unnormalized distribution as a map from values to log
+    probabilities, returns the normalized distribution (not in log space),
+    using the log-sum-exp trick so that it does not underflow."""
+    m = max(log_probabilities.itervalues())
+    if m == float('-inf'):
+        raise ZeroDivisionError("every value has zero probability")
+    e = dict((k,math.exp(v-m)) for (k,v) in log_probabilities.iteritems())
+    vtotal = sum(e.values())
+    return dict((k,v/vtotal) for k,v in e.iteritems())
+
+def naive_bayes_log(class_probabilities,feature_probabilities,instance):
+    """Naive Bayes inference in log space.  Computes the same P(C|F=finstance)
+    as naive_bayes, but sums log probabilities instead of multiplying them, so
+    the result does not underflow no matter how many features there are.
+    """
+    classes = class_probabilities.keys()
+    scores = [safe_log(class_probabilities[c]) for c in classes]
+    for (kf,vf) in feature_probabilities.iteritems():
+        v = instance[kf]
+        scores = [s + safe_log(vf[c][v]) for (s,c) in zip(scores,classes)]
+    return log_normalize(dict(zip(classes,scores)))
+
+def posterior_batch(log_prior,log_columns,rows):
+    """Computes normalized posteriors of encoded rows from log probabilities,
+    where log_prior[i] = log P(C=ci) and log_columns[i][j][v] = log
+    P(Fj=v|C=ci) for value code v.  Returns one tuple of P(C=ci|F=row) per
+    row.  Identical rows share one posterior, so each distinct row is scored
+    once.
+    """
+    with hw4_profile.stage("batch inference") as s:
+        s.add_rows(len(rows))
+        return posterior_batch_distinct(log_prior,log_columns,rows)
+
+def posterior_batch_distinct(log_prior,log_columns,rows):
+    """Computes posterior_batch, scoring each distinct row once"""
+    keys = map(tuple,rows)
+    distinct = list(set(keys))
+    if len(distinct) == 0: return []
+    posteriors = dict(zip(distinct,score_columns(log_prior,log_columns,zip(*distinct),len(distinct))))
+    return map(posteriors.__getitem__,keys)
+
+def score_columns(log_prior,log_columns,columns,n):
+    """Returns the posteriors of n encoded rows given as feature columns"""
+    #accumulate log P(C) + sum_k log P(Fk|C) for each class, gathering one
+    #whole feature column from the table at a time
+    scores = []
+    for (lp,tables) in zip(log_prior,log_columns):
+        s = [lp]*n
+        for (column,table) in zip(columns,tables):
+            s = map(operator.add,s,map(table.__getitem__,column))
+        scores.append(s)
+    #normalize with log-sum-exp, again column-wise
+    m = map(max,*scores) if len(scores) > 1 else scores[0]
+    e = [map(math.exp,map(operator.sub,s,m)) for s in scores]
+    total = reduce(lambda a,b:map(operator.add,a,b),e)
+    return zip(*[map(operator.truediv,ei,total) for ei in e])
+
+def posterior_batch_targets(models,rows):
+    """posterior_batch for several models over the same encoded rows, given
+    as a list of (log_prior,log_columns) pairs.  The rows are deduplicated
+    and split into columns once for all the models.  Returns one list of
+    posteriors per model."""
+    with hw4_profile.stage("batch inference") as s:
+        s.add_rows(len(rows))
+        keys = map(tuple,rows)
+        distinct = list(set(keys))
+        if len(distinct) == 0: return [[] for m in models]
+        columns = zip(*distinct)
+        res = []
+        for (log_prior,log_columns) in models:
+            posteriors = dict(zip(distinct,score_columns(log_prior,log_columns,columns,len(distinct))))
+            res.append(map(posteriors.__getitem__,keys))
+        return res
+
 def p1():
     class_probabilities = {'Spam':0.4, 'Not-Spam':0.6}
     feature_probabilities = {
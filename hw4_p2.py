@@ -1,3 +1,8 @@
+from collections import defaultdict
+import operator
+
+import hw4_profile
+
 
 def uniform(domain):
     """Return a uniform distribution over the given domain"""
@@ -30,6 +35,68 @@ def learn_discrete(dataset,virtual_count=1,domain=None):
 
     return a
 
+def count_naive_bayes(class_key,feature_keys,dataset):
+    """Counts everything a Naive Bayes model needs in a single pass over
+    the dataset.  Returns a pair (CC,CF) where CC[c] is the number of
+    instances of class c and CF[f][c][v] is the number of instances of
+    class c whose feature f has value v.
+    """
+    class_counts = defaultdict(int)
+    feature_counts = dict((f,defaultdict(lambda:defaultdict(int))) for f in feature_keys)
+    for instance in dataset:
+        c = instance[class_key]
+        class_counts[c] += 1
+        for f in feature_keys:
+            feature_counts[f][c][instance[f]] += 1
+    return (class_counts,feature_counts)
+
+def count_naive_bayes_columns(class_column,feature_columns):
+    """Same as count_naive_bayes, but given the dataset as columns: the
+    class value of each instance, and feature_columns[f], the value of
+    feature f of each instance."""
+    class_counts = defaultdict(int)
+    for c in class_column:
+        class_counts[c] += 1
+    feature_counts = dict()
+    for (f,column) in feature_columns.iteritems():
+        Cf = defaultdict(lambda:defaultdict(int))
+        for (c,v) in zip(class_column,column):
+            Cf[c][v] += 1
+        feature_counts[f] = Cf
+    return (class_counts,feature_counts)
+
+def discrete_from_counts(counts,total,virtual_count=1,domain=None):
+    """Same distribution as learn_discrete, but given a table counts[v] of
+    the number of times each value v appears in a dataset of size total."""
+    if(domain==None):
+        domain = counts.keys()
+    denominator = float(len(domain)*virtual_count + total)
+    return dict((v,(counts.get(v,0) + virtual_count) / denominator) for v in domain)
+
+def naive_bayes_from_counts(class_counts,feature_counts,
+                            class_prior_count=1,feature_posterior_count=1,
+                            class_domain=None,feature_domains=None):
+    """Turns the count tables produced by count_naive_bayes into the smoothed
+    (PC,PF) pair returned by learn_naive_bayes."""
+    if class_domain == None:
+        class_domain = set(c for (c,n) in class_counts.iteritems() if n > 0)
+    if feature_domains == None:
+        feature_domains = dict()
+    for f in feature_counts:
+        if f not in feature_domains:
+            feature_domains[f] = set(v for PFc in feature_counts[f].itervalues()
+                                     for (v,n) in PFc.iteritems() if n > 0)
+    total = sum(class_counts.itervalues())
+    PClearned = discrete_from_counts(class_counts,total,class_prior_count,class_domain)
+    PFlearned = dict()
+    for (f,Cf) in feature_counts.iteritems():
+        class_info = {}
+        for class_ in class_domain:
+            class_info[class_] = discrete_from_counts(Cf.get(class_,{}),class_counts.get(class_,0),
+                                                      feature_posterior_count,feature_domains[f])
+        PFlearned[f] = class_info
+    return (PClearned,PFlearned)
+
 def learn_naive_bayes(class_key,feature_keys,
                       dataset,
                       class_prior_count=1,feature_posterior_count=1,
@@ -40,6 +107,76 @@ def learn_naive_bayes(class_key,feature_keys,
     to a conditional distributions.  Like in problem 1, a conditional
     distribution p gives P(F=f|C=f) in a table p[c_value][f_value].
     
+    The prior counts are "virtual counts" for each value in the class's domain
+    and the features' domains.
+
+    All counts are gathered in one pass over the dataset (count_naive_bayes).
+    """
+    with hw4_profile.stage("train") as s:
+        s.add_rows(len(dataset))
+        (class_counts,feature_counts) = count_naive_bayes(class_key,feature_keys,dataset)
+        #the feature posteriors have always been smoothed with one virtual count,
+        #see learn_naive_bayes_reference
+        return naive_bayes_from_counts(class_counts,feature_counts,
+                                       class_prior_count,1,
+                                       class_domain,feature_domains)
+
+def count_naive_bayes_targets(class_keys,feature_keys,dataset):
+    """count_naive_bayes for several class keys at once, in a single pass
+    over the dataset.  Each instance is reduced to its (class values,
+    feature values) pattern, and the per-target counts are then taken from
+    the distinct patterns.  Returns a dictionary mapping each class key to
+    its (CC,CF) pair."""
+    def getter(keys):
+        if len(keys) == 1:
+            return lambda instance:(instance[keys[0]],)
+        return operator.itemgetter(*keys) if keys else lambda instance:()
+    (class_values,feature_values) = (getter(list(class_keys)),getter(list(feature_keys)))
+    patterns = defaultdict(int)
+    for instance in dataset:
+        patterns[(class_values(instance),feature_values(instance))] += 1
+    res = dict()
+    for (i,class_key) in enumerate(class_keys):
+        class_counts = defaultdict(int)
+        feature_counts = dict((f,defaultdict(lambda:defaultdict(int))) for f in feature_keys)
+        for ((classes,values),n) in patterns.iteritems():
+            c = classes[i]
+            class_counts[c] += n
+            for (f,v) in zip(feature_keys,values):
+                feature_counts[f][c][v] += n
+        res[class_key] = (class_counts,feature_counts)
+    return res
+
+def learn_naive_bayes_targets(class_keys,feature_keys,
+                              dataset,
+                              class_prior_count=1,feature_posterior_count=1):
+    """Learns one Naive Bayes model per class key on the same features, from
+    a single pass over the dataset (count_naive_bayes_targets).  The feature
+    domains are shared by all the models.  Returns a dictionary mapping each
+    class key to the (PC,PF) pair learn_naive_bayes would return for it."""
+    with hw4_profile.stage("train") as s:
+        s.add_rows(len(dataset))
+        counts = count_naive_bayes_targets(class_keys,feature_keys,dataset)
+        feature_domains = dict()
+        return dict((k,naive_bayes_from_counts(counts[k][0],counts[k][1],
+                                               class_prior_count,1,
+                                               None,feature_domains))
+                    for k in class_keys)
+
+def learn_naive_bayes_reference(class_key,feature_keys,
+                      dataset,
+                      class_prior_count=1,feature_posterior_count=1,
+                      class_domain=None,feature_domains=None):
+    """The original Naive Bayes estimator, which rescans the dataset once per
+    (feature,class) pair.  Kept as a reference for learn_naive_bayes and for
+    benchmarking; it returns exactly the same (PC,PF).
+
+    Estimating a Naive Bayes model from data.  Given a list of instances,
+    learns a class prior P(C) and feature posteriors P(F1|C),...,P(Fk|C).
+    Returns a pair (PC,PF) where PF is a dictionary mapping feature names
+    to a conditional distributions.  Like in problem 1, a conditional
+    distribution p gives P(F=f|C=f) in a table p[c_value][f_value].
+    
     The prior counts are "virtual counts" for each value in the class's domain
     and the features' domains.
     """
@@ -1,8 +1,18 @@
 from __future__ import with_statement
+import bisect
 import csv
+import itertools
+import multiprocessing
+import operator
+import os
+import sys
+import time
+from collections import defaultdict
 
-from hw4_p1 import naive_bayes
-from hw4_p2 import learn_naive_bayes
+from hw4_p2 import count_naive_bayes_columns, naive_bayes_from_counts
+from hw4_cache import load_columns, column_values
+from hw4_model import NaiveBayesCounts, NaiveBayesModel, MultiTargetModel
+import hw4_profile
 
 
 def loadgames(fn="2017 NCAAM Game Results Data.csv"):
@@ -44,8 +54,9 @@ def transformToBooleanFeatures(gamefeatures):
     for (f,v) in gamefeatures.iteritems():
         if f not in statvars_team_avgs and f not in statvars_opp_avgs and f not in namevars and f not in record_vars:
             res[f] = int(v)
-    res["Differential_kinda_better"] = 1 if gamefeatures["Team Differential"] > gamefeatures['Opponent Differential'] and 5 > (float(gamefeatures["Team Differential"]) - float(gamefeatures['Opponent Differential'])) else 0
-    res["Differential_much_better"] = 1 if gamefeatures["Team Differential"] > gamefeatures['Opponent Differential'] and (float(gamefeatures["Team Differential"]) - float(gamefeatures['Opponent Differential'])) > 5 else 0
+    differential = float(gamefeatures["Team Differential"]) - float(gamefeatures['Opponent Differential'])
+    res["Differential_kinda_better"] = 1 if differential > 0 and 5 > differential else 0
+    res["Differential_much_better"] = 1 if differential > 0 and differential > 5 else 0
     for f in statvars:
         res[f+"_avg_better"] = 1 if betterStatThanOpponent(gamefeatures,f) else 0
         res[f+"Allowed_avg_better"] = 1 if betterStatThanOpponent(gamefeatures,f+"Allowed") else 0
@@ -53,12 +64,80 @@ def transformToBooleanFeatures(gamefeatures):
     res["losses_better"] = 1 if int(gamefeatures['team_losses']) > int(gamefeatures['opp_losses']) else 0
     return res
 
-origfeatures = loadfeatures()
-transformedfeatures = [transformToBooleanFeatures(f) for f in origfeatures]
+def transformToBooleanColumns(table):
+    """Computes the boolean features of transformToBooleanFeatures for a whole
+    features table at once, as loaded by hw4_cache.load_columns.  Returns a
+    dictionary mapping each boolean feature to its column, a list of 0/1."""
+    columns = table['columns']
+    res = dict()
+    record_vars = ['team_wins','team_losses','opp_wins','opp_losses','Team Differential','Opponent Differential']
+    for f in table['names']:
+        if f not in statvars_team_avgs and f not in statvars_opp_avgs and f not in namevars and f not in record_vars:
+            res[f] = map(int,columns[f])
+    differential = map(operator.sub,columns["Team Differential"],columns['Opponent Differential'])
+    res["Differential_kinda_better"] = [1 if 0 < d < 5 else 0 for d in differential]
+    res["Differential_much_better"] = [1 if d > 5 else 0 for d in differential]
+    for f in statvars:
+        for item in [f,f+"Allowed"]:
+            res[item+"_avg_better"] = map(int,map(operator.gt,columns['team_avg_'+item],columns['opp_avg_'+item]))
+    res["wins_better"] = map(int,map(operator.ge,columns['team_wins'],columns['opp_wins']))
+    res["losses_better"] = map(int,map(operator.gt,columns['team_losses'],columns['opp_losses']))
+    return res
+
+#the features file used when none is given; nothing is loaded until a
+#dataset is asked for
+features_fn = "2017 NCAAM Game Results Features.csv"
+loaded_datasets = dict()
 
-#the prediction variables should be taken from this set
-non_name_variables = [f for f in transformedfeatures[0].keys() if f != "team_won"]
+#the games file each known features file was computed from
+games_fns = {features_fn:"2017 NCAAM Game Results Data.csv"}
 
+def load_dataset(fn=None):
+    """Loads and transforms the given features file (features_fn by
+    default) the first time it is asked for, and returns the same memoized
+    dataset afterwards.  The dataset is a dictionary with elements:
+    - table: the columns of the features file, from hw4_cache.load_columns
+    - columns: the boolean feature columns, from transformToBooleanColumns
+    - transformedfeatures: the rows of the boolean features, as
+      transformToBooleanFeatures would return them
+    - non_name_variables: the variables the predictions should be taken from
+    """
+    if fn == None:
+        fn = features_fn
+    if fn not in loaded_datasets:
+        table = load_columns(fn)
+        with hw4_profile.stage("transform") as s:
+            s.add_rows(table['nrows'])
+            columns = transformToBooleanColumns(table)
+            names = columns.keys()
+            transformedfeatures = [dict(zip(names,row)) for row in zip(*[columns[f] for f in names])]
+        #the prediction variables should be taken from this set
+        non_name_variables = [f for f in transformedfeatures[0].keys() if f != "team_won"]
+        loaded_datasets[fn] = {'table':table,'columns':columns,
+                               'transformedfeatures':transformedfeatures,
+                               'non_name_variables':non_name_variables}
+    return loaded_datasets[fn]
+
+
+def sparseInstances(dataset,prediction_variables,team_indicators=True):
+    """Converts a dataset from load_dataset into instances for a
+    SparseNaiveBayesModel: each instance is the list of ids of its active
+    features, the prediction variables that are 1 and, with team_indicators,
+    one "Team=name" and one "Opponent=name" indicator.  Returns a triple
+    (features,instances,labels) with the feature names by id and the
+    team_won label of each instance."""
+    columns = dataset['columns']
+    features = list(prediction_variables)
+    id_columns = [[j if v else None for v in columns[f]] for (j,f) in enumerate(features)]
+    if team_indicators:
+        table = dataset['table']
+        for name in ["Team","Opponent"]:
+            vocabulary = table['vocabularies'][name]
+            offset = len(features)
+            features += [name+"="+t for t in vocabulary]
+            id_columns.append([offset+k for k in table['columns'][name]])
+    instances = [[j for j in row if j != None] for row in zip(*id_columns)]
+    return (features,instances,list(columns["team_won"]))
 
 def classifier_accuracy(probabilistic_classifier,p_threshold,testset,target):
     """Given a probabilistic classification function such that the target
@@ -78,54 +157,134 @@ def classifier_accuracy(probabilistic_classifier,p_threshold,testset,target):
     - accuracy: overall accuracy
     """
 
-    
-
-    n = len(testset)
     num_tp = 0.
     num_fp = 0.
     num_tn = 0.
     num_fn = 0.
-    for item in testset:
-        #this is the predicted label of the item
-        predict_pos = (probabilistic_classifier(item) > p_threshold)
-        #this is the actual label of the item
-        actually_pos = item[target]                             #changed from test set to item
-        #TODO: fill me in
-
-        #print(predict_pos,actually_pos)
-
-        if predict_pos == True and actually_pos == 1:
-            num_tp += 1 
-        elif predict_pos == True and actually_pos == 0:
-            num_fp += 1
-        elif predict_pos == False and actually_pos == 1:
-            num_fn += 1
-        else:
-            num_tn += 1 
-
-    #TODO: fill me in
+    with hw4_profile.stage("evaluate") as evaluation:
+        evaluation.add_rows(len(testset))
+        #the predicted labels of the items
+        with hw4_profile.stage("inference") as inference:
+            inference.add_rows(len(testset))
+            predictions = [probabilistic_classifier(item) > p_threshold for item in testset]
+        for (item,predict_pos) in zip(testset,predictions):
+            #this is the actual label of the item
+            actually_pos = item[target]                             #changed from test set to item
+
+            if predict_pos == True and actually_pos == 1:
+                num_tp += 1 
+            elif predict_pos == True and actually_pos == 0:
+                num_fp += 1
+            elif predict_pos == False and actually_pos == 1:
+                num_fn += 1
+            else:
+                num_tn += 1 
+
+    return accuracy_stats(num_tp,num_fp,num_tn,num_fn)
+
+def model_accuracy(model,p_threshold,rows,labels,weights=None):
+    """The classifier_accuracy stats of a NaiveBayesModel of a boolean
+    concept, which predicts positive when P(C=1|row) > p_threshold, on the
+    encoded rows (see NaiveBayesModel.encode) whose actual values are
+    labels.  The rows are scored in one batch.  If weights is given,
+    weights[i] is the number of instances row i stands for."""
+    with hw4_profile.stage("evaluate") as s:
+        s.add_rows(len(rows))
+        positive = model.class_codes[1]
+        if weights == None:
+            weights = itertools.repeat(1)
+        num = defaultdict(float)
+        for (p,actual,n) in itertools.izip(model.predict_proba(rows),labels,weights):
+            num[(p[positive] > p_threshold,actual == 1)] += n
+        return accuracy_stats(num[(True,True)],num[(True,False)],
+                              num[(False,False)],num[(False,True)])
+
+def accuracy_stats(num_tp,num_fp,num_tn,num_fn):
+    """Given the (float) numbers of true and false positives and negatives,
+    returns the statistics dictionary described in classifier_accuracy."""
+    n = num_tp + num_fp + num_tn + num_fn
     if num_tp != 0:
         precision = num_tp / (num_tp+num_fp)
     else:
         precision = 0  
-    recall = num_tp / (num_tp+num_fn)
+    if num_tp != 0:
+        recall = num_tp / (num_tp+num_fn)
+    else:
+        recall = 0
 
     accuracy = (num_tp + num_tn) / n 
     return {'tp':num_tp,'fp':num_fp,
             'tn':num_tn,'fn':num_fn,
             'precision':precision,'recall':recall,'accuracy':accuracy}
 
-def learn(prediction_variables,virtual_counts=1,p_threshold=0.5,print_result=True):
-    """Do the learning on the given prediction variables.
+def threshold_sweep(probabilistic_classifier,testset,target):
+    """Evaluates a probabilistic classification function at every threshold
+    at once.  The classifier is run once per instance; the instances are then
+    sorted by probability, and the accuracy statistics at each distinct
+    threshold are updated incrementally, in O(N log N) overall.
+
+    Return value is a dictionary with elements:
+    - thresholds: list of (p_threshold,stats) pairs, from the highest
+      threshold (nothing predicted positive) to -inf (everything predicted
+      positive), where stats is what classifier_accuracy would return for
+      p_threshold
+    - roc: list of (false positive rate,true positive rate) points
+    - pr: list of (recall,precision) points
+    - auc: area under the ROC curve
+    - best: the (p_threshold,stats) pair with the highest accuracy
+
+    Raises ValueError if the test set is empty, since no statistic is
+    defined then.
+    """
+    scored = sorted(((probabilistic_classifier(item),item[target] == 1) for item in testset),reverse=True)
+    if len(scored) == 0:
+        raise ValueError("cannot sweep thresholds over an empty test set")
+    num_pos = float(sum(1 for (p,actual) in scored if actual))
+    num_neg = len(scored) - num_pos
+    num_tp = 0.
+    num_fp = 0.
+    thresholds = []
+    i = 0
+    while True:
+        #everything scored above the current threshold is predicted positive
+        threshold = scored[i][0] if i < len(scored) else float('-inf')
+        stats = accuracy_stats(num_tp,num_fp,num_neg-num_fp,num_pos-num_tp)
+        thresholds.append((threshold,stats))
+        if i == len(scored):
+            break
+        while i < len(scored) and scored[i][0] == threshold:
+            if scored[i][1]:
+                num_tp += 1
+            else:
+                num_fp += 1
+            i += 1
+    roc = [(s['fp']/num_neg if num_neg else 0.,s['recall']) for (t,s) in thresholds]
+    pr = [(s['recall'],s['precision']) for (t,s) in thresholds]
+    auc = sum((x1-x0)*(y0+y1)/2 for ((x0,y0),(x1,y1)) in zip(roc,roc[1:]))
+    best = max(thresholds,key=lambda ts:ts[1]['accuracy'])
+    return {'thresholds':thresholds,'roc':roc,'pr':pr,'auc':auc,'best':best}
+
+def learn(prediction_variables,virtual_counts=1,p_threshold=0.5,print_result=True,fn=None,model_fn=None):
+    """Do the learning on the given prediction variables, using the features
+    file fn (features_fn by default).  If model_fn is given, the model is
+    also saved there as a NaiveBayesModel file, with the virtual counts and
+    threshold.
     Returns the Naive Bayes parameters and the training accuracy."""
-    global transformedfeatures
+    columns = load_dataset(fn)['columns']
     print "Learning on",prediction_variables
 
-    #Do the learning
-    (pWon,pFeatures)=learn_naive_bayes("team_won",prediction_variables,
-                                  transformedfeatures,
-                                  virtual_counts,virtual_counts)
+    #Do the learning, counting straight from the boolean feature columns
+    with hw4_profile.stage("train") as s:
+        s.add_rows(len(columns["team_won"]))
+        (class_counts,feature_counts) = count_naive_bayes_columns(columns["team_won"],
+                                                                  dict((f,columns[f]) for f in prediction_variables))
+        (pWon,pFeatures) = naive_bayes_from_counts(class_counts,feature_counts,virtual_counts,1)
+
 
+    model = NaiveBayesModel.from_dicts(pWon,pFeatures,prediction_variables)
+    if model_fn != None:
+        model.metadata.update({'virtual_counts':virtual_counts,'p_threshold':p_threshold})
+        model.save(model_fn)
 
     #Print the probability distributions
     if print_result:
@@ -136,13 +295,9 @@ def learn(prediction_variables,virtual_counts=1,p_threshold=0.5,print_result=Tru
 
 
     #compute the accuracy
-    def eval_probability(x):
-        justfeatures = dict((f,x[f]) for f in pFeatures.keys())
-        return naive_bayes(pWon,pFeatures,justfeatures)[1]
-
-    stats = classifier_accuracy(eval_probability,p_threshold,transformedfeatures,"team_won")
+    stats = model_accuracy(model,p_threshold,model.encode_columns(columns),columns["team_won"])
     if print_result:
-        n = len(transformedfeatures)    
+        n = len(columns["team_won"])
         print
         print "Training error:"
         print "%d/%d true positives, %d/%d true negatives"%(stats['tp'],n,stats['tn'],n)
@@ -151,13 +306,265 @@ def learn(prediction_variables,virtual_counts=1,p_threshold=0.5,print_result=Tru
         print "Total accuracy:",stats['accuracy']
     return (pWon,pFeatures,stats['accuracy'])
 
+def iterchunks(fn,chunk_size=10000):
+    """Reads the rows of a CSV file as dictionaries, chunk_size rows at a
+    time, without ever holding more than one chunk in memory"""
+    with open(fn,"r") as csvfile:
+        reader = csv.DictReader(csvfile)
+        while True:
+            chunk = list(itertools.islice(reader,chunk_size))
+            if len(chunk) == 0:
+                break
+            yield chunk
+
+def learn_streaming(prediction_variables,fns=None,virtual_counts=1,chunk_size=10000):
+    """Trains on the given features files (by default [features_fn]) in one
+    streaming pass, transforming and counting chunk_size rows at a time, so
+    that memory does not grow with the size of the files.  The domains of the
+    class and features are discovered from the counts.  Returns the
+    NaiveBayesCounts; its distributions() are the Naive Bayes parameters."""
+    if fns == None:
+        fns = [features_fn]
+    counts = NaiveBayesCounts("team_won",prediction_variables,virtual_counts,virtual_counts)
+    for fn in fns:
+        for chunk in iterchunks(fn,chunk_size):
+            counts.add(transformToBooleanFeatures(f) for f in chunk)
+    return counts
+
+def lines_until(f,stop):
+    """Yields the lines of the file f from its current position, until a
+    line starts at or after byte stop (None for the end of the file)"""
+    while stop == None or f.tell() < stop:
+        line = f.readline()
+        if not line:
+            break
+        yield line
+
+def count_shard(shard):
+    """Counts one shard (fn,start,stop,prediction_variables,virtual_counts)
+    of the features file fn: the rows whose line starts at a byte from start
+    up to stop (None for the end of the file).  Only the header and the
+    shard's own rows are read.  Returns a NaiveBayesCounts."""
+    (fn,start,stop,prediction_variables,virtual_counts) = shard
+    counts = NaiveBayesCounts("team_won",prediction_variables,virtual_counts,virtual_counts)
+    with open(fn,"rb") as csvfile:
+        names = csv.reader([csvfile.readline()]).next()
+        if start > csvfile.tell():
+            #skip the rest of the line the shard starts in, which belongs
+            #to the previous shard
+            csvfile.seek(start-1)
+            csvfile.readline()
+        rows = (dict(zip(names,row)) for row in csv.reader(lines_until(csvfile,stop)) if row)
+        counts.add(transformToBooleanFeatures(f) for f in rows)
+    return counts
+
+def byte_shards(fn,num_shards):
+    """Splits the rows of a features file, one per line as save_features
+    writes them, into num_shards byte ranges of about the same size, without
+    reading more than its header.  Returns a
+    list of (fn,start,stop) triples for count_shard."""
+    with open(fn,"rb") as csvfile:
+        csvfile.readline()
+        header = csvfile.tell()
+    size = os.path.getsize(fn)
+    bounds = [header+(size-header)*i//num_shards for i in range(num_shards+1)]
+    return [(fn,start,stop) for (start,stop) in zip(bounds,bounds[1:])]
+
+def learn_sharded(prediction_variables,shards=None,virtual_counts=1,processes=None):
+    """Trains on the given shards in a process pool and merges their counts.
+    Shards are (fn,start,stop) byte ranges, e.g. from byte_shards, or whole
+    features files given by name (e.g. one file per season).  By default
+    the shards are one range per processor of features_fn.  Returns the
+    merged NaiveBayesCounts; its distributions() are the Naive Bayes
+    parameters."""
+    if processes == None:
+        processes = multiprocessing.cpu_count()
+    if shards == None:
+        shards = byte_shards(features_fn,processes)
+    jobs = []
+    for shard in shards:
+        (fn,start,stop) = (shard,0,None) if isinstance(shard,basestring) else shard
+        jobs.append((fn,start,stop,prediction_variables,virtual_counts))
+    if processes == 1:
+        parts = map(count_shard,jobs)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            parts = pool.map(count_shard,jobs)
+        finally:
+            pool.terminate()
+    counts = NaiveBayesCounts("team_won",prediction_variables,virtual_counts,virtual_counts)
+    for part in parts:
+        counts.merge(part)
+    return counts
+
+def pattern_counts(dataset,feature_keys,target):
+    """Returns a table mapping each distinct (feature values,target value)
+    pair of the dataset to the number of instances that have it.  The feature
+    values are a tuple in the order of feature_keys."""
+    counts = defaultdict(int)
+    for instance in dataset:
+        counts[(tuple(instance[f] for f in feature_keys),instance[target])] += 1
+    return counts
+
+#Bucket edges of the targets besides team_won, from the games file: the
+#team's margin of victory and the total points of the game.  Bucket i holds
+#the values from edges[i-1] up to, but excluding, edges[i].
+margin_edges = [-10,1,11]
+total_edges = [130,145,160]
+
+def bucket(value,edges):
+    """Returns the index of the bucket of value between the sorted edges"""
+    return bisect.bisect(edges,value)
+
+def game_targets(dataset,games_fn):
+    """Returns the targets of each game of a dataset from load_dataset, as a
+    dictionary mapping each target to its column: team_won,
+    margin_bucket (the bucket of Team Margin between margin_edges) and
+    total_bucket (the bucket of the total score between total_edges).  The
+    games are looked up by date, team and opponent in games_fn, the games
+    file the dataset's features were computed from; its dates may be
+    written without leading zeros."""
+    results = dict()
+    for g in loadgames(games_fn):
+        results[(time.strptime(g["Date"],"%m/%d/%Y"),g["Team"],g["Opponent"])] = g
+    table = dataset['table']
+    dates = [time.strptime(d,"%m/%d/%Y") for d in column_values(table,"Date")]
+    keys = zip(dates,column_values(table,"Team"),column_values(table,"Opponent"))
+    games = [results[k] for k in keys]
+    return {'team_won':list(dataset['columns']["team_won"]),
+            'margin_bucket':[bucket(int(g["Team Margin"]),margin_edges) for g in games],
+            'total_bucket':[bucket(int(g["Team Score"])+int(g["Opponent Score"]),total_edges) for g in games]}
+
+def learn_targets(prediction_variables,targets=None,virtual_counts=1,print_result=True,fn=None,games_fn=None):
+    """Learns a Naive Bayes model for each of the given targets of
+    game_targets (all of them by default) on the same prediction variables,
+    with one pass over the features file fn (features_fn by default), and
+    scores every target in one batch.  The targets come from games_fn, the
+    games file the features were computed from, which is needed unless fn
+    is in games_fns.  Returns the MultiTargetModel and a dictionary with the
+    training accuracy of each target, predicting its most probable value."""
+    if fn == None:
+        fn = features_fn
+    if games_fn == None:
+        if fn not in games_fns:
+            raise ValueError("the games file of %s must be given"%(fn,))
+        games_fn = games_fns[fn]
+    dataset = load_dataset(fn)
+    target_columns = game_targets(dataset,games_fn)
+    if targets == None:
+        targets = sorted(target_columns.keys())
+    instances = []
+    for (x,values) in zip(dataset['transformedfeatures'],zip(*[target_columns[t] for t in targets])):
+        instance = dict(x)
+        instance.update(zip(targets,values))
+        instances.append(instance)
+    model = MultiTargetModel.learn(targets,prediction_variables,instances,virtual_counts,virtual_counts)
+    predictions = model.predict(model.encode(instances))
+    accuracies = dict()
+    for t in targets:
+        correct = sum(1 for (p,actual) in zip(predictions[t],target_columns[t]) if p == actual)
+        accuracies[t] = float(correct)/len(instances)
+        if print_result:
+            print "Training accuracy of %s: %f"%(t,accuracies[t])
+    return (model,accuracies)
+
+#the shared table of the feature search, set up once in each worker
+search_table = None
+
+def init_feature_search(table):
+    """Pool initializer that installs the shared table of feature_search"""
+    global search_table
+    search_table = table
+
+def subset_accuracy(subset):
+    """Returns the classifier_accuracy stats of a Naive Bayes model on the
+    features in subset, trained and evaluated on the dataset summarized in
+    search_table.  Uses only the precomputed counts, never the dataset."""
+    (feature_keys,patterns,class_counts,feature_counts,virtual_counts,p_threshold) = search_table
+    (pWon,pFeatures) = naive_bayes_from_counts(class_counts,
+                                               dict((f,feature_counts[f]) for f in subset),
+                                               virtual_counts,1)
+    model = NaiveBayesModel.from_dicts(pWon,pFeatures,subset)
+    columns = [feature_keys.index(f) for f in subset]
+    patterns = patterns.items()
+    instances = [dict((f,values[j]) for (f,j) in zip(subset,columns)) for ((values,actual),n) in patterns]
+    return model_accuracy(model,p_threshold,model.encode(instances),
+                          [actual for ((values,actual),n) in patterns],
+                          [n for ((values,actual),n) in patterns])
+
+def feature_search(candidates=None,direction="forward",
+                   virtual_counts=1,p_threshold=0.5,processes=None,fn=None):
+    """Greedy feature subset selection for predicting team_won.
+
+    Starting from no features (forward) or all candidates (backward), each
+    round scores every subset that adds (removes) one feature in a process
+    pool, and moves to the most accurate one, until no move improves the
+    training accuracy.  All subsets are scored from one table of counts built
+    in a single pass over the data.  processes=1 scores in this process.
+
+    The data comes from the features file fn (features_fn by default).
+    Returns a pair (subset,stats) with the classifier_accuracy stats of the
+    best subset found.
+    """
+    dataset = load_dataset(fn)
+    transformedfeatures = dataset['transformedfeatures']
+    if candidates == None:
+        candidates = dataset['non_name_variables']
+    candidates = list(candidates)
+    columns = dataset['columns']
+    (class_counts,feature_counts) = count_naive_bayes_columns(columns["team_won"],
+                                                              dict((f,columns[f]) for f in candidates))
+    table = (candidates,pattern_counts(transformedfeatures,candidates,"team_won"),
+             class_counts,feature_counts,virtual_counts,p_threshold)
+    if processes == 1:
+        init_feature_search(table)
+        evaluate = map
+    else:
+        pool = multiprocessing.Pool(processes,init_feature_search,(table,))
+        evaluate = pool.map
+    try:
+        current = [] if direction == "forward" else list(candidates)
+        best = evaluate(subset_accuracy,[current])[0]
+        while True:
+            if direction == "forward":
+                moves = [current+[f] for f in candidates if f not in current]
+            else:
+                moves = [[g for g in current if g != f] for f in current]
+            if len(moves) == 0:
+                break
+            results = evaluate(subset_accuracy,moves)
+            (stats,subset) = max(zip(results,moves),key=lambda r:r[0]['accuracy'])
+            if stats['accuracy'] <= best['accuracy']:
+                break
+            (best,current) = (stats,subset)
+    finally:
+        if processes != 1:
+            pool.terminate()
+    return (current,best)
+
 if __name__=="__main__":
+    #run with --profile for a report of where the time goes, and a cProfile
+    #dump in hw4_p3.prof
+    profiling = "--profile" in sys.argv
+    if profiling:
+        hw4_profile.enable(profile=True)
+
     #TODO: play around with which variables to include in prediction
     #this line uses all variables
-    prediction_variables = non_name_variables
+    prediction_variables = load_dataset()['non_name_variables']
     #prediction_variables = ['Score_avg_better']
     #prediction_variables = ['wins_better']
     #prediction_variables = []
+    #or search for the best subset
+    #prediction_variables = feature_search(direction="forward",p_threshold=0.47)[0]
 
     learn(prediction_variables,p_threshold=0.47)
+    #or learn the margin and total score buckets too
+    #learn_targets(prediction_variables)
+
+    if profiling:
+        print
+        hw4_profile.print_report()
+        hw4_profile.dump_profile("hw4_p3.prof")
 
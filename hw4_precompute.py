@@ -1,18 +1,11 @@
 from __future__ import with_statement
+from array import array
+import bisect
 import csv
 import time
 from collections import defaultdict
 
-#load games and extract teams
-teams = set()
-games = []
-with open("2017 NCAAM Game Results Data.csv","r") as csvfile:
-    reader = csv.DictReader(csvfile)
-    for row in reader:
-        teams.add(row['Team'])
-        teams.add(row['Opponent'])
-        games.append(row)
-
+import hw4_profile
 
 statvars = ["Score"]
 
@@ -21,29 +14,76 @@ typeConverters = dict([(v,int) for v in ["Team Score","Opponent Score","Team Mar
 typeConverters["Date"] = lambda(x):time.strptime(x,"%m/%d/%Y")
 typeConverters["Team Differential"] = lambda(x):float(x) if len(x.strip())>0 else None
 typeConverters["Opponent Differential"] = lambda(x):float(x) if len(x.strip())>0 else None
-for game in games:
-    for (k,v) in typeConverters.iteritems():
-        game[k] = v(game[k])
-
-#remove duplicates with where team vs opponent is flipped
-uniquegames = []
-gamesbydate = defaultdict(list)
-uniquegamesbydate = dict()
-for g in games:
-    gamesbydate[g["Date"]].append(g)
-for date,dgames in sorted(gamesbydate.items()):
-    unique = []
-    for g in dgames:
-        if all(g["Team"]!=h["Opponent"] for h in unique):
-            unique.append(g)
-    uniquegames += unique
-    uniquegamesbydate[date] = unique
-print len(games),"records,",len(uniquegames),"unique"
-
-gamesbyteam = defaultdict(list)
-for game in uniquegames:
-    gamesbyteam[game['Team']].append(game)
-    gamesbyteam[game['Opponent']].append(game)
+
+#the games file used when none is given; nothing is loaded until a season
+#is asked for
+games_fn = "2017 NCAAM Game Results Data.csv"
+features_fn = "2017 NCAAM Game Results Features.csv"
+loaded_seasons = dict()
+
+def load_typed_games(fn):
+    """Loads the games of the given file, converting the types of the
+    values with typeConverters.  Returns a pair (teams,games)."""
+    teams = set()
+    games = []
+    with open(fn,"r") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            teams.add(row['Team'])
+            teams.add(row['Opponent'])
+            games.append(row)
+    for game in games:
+        for (k,v) in typeConverters.iteritems():
+            game[k] = v(game[k])
+    return (teams,games)
+
+def removeDuplicates(games):
+    """Removes the duplicates of games where team vs opponent is flipped.
+    Returns a pair (uniquegames,uniquegamesbydate), with the unique games
+    sorted by date."""
+    uniquegames = []
+    gamesbydate = defaultdict(list)
+    uniquegamesbydate = dict()
+    for g in games:
+        gamesbydate[g["Date"]].append(g)
+    for date,dgames in sorted(gamesbydate.items()):
+        unique = []
+        opponents = set()
+        for g in dgames:
+            if g["Team"] not in opponents:
+                unique.append(g)
+                opponents.add(g["Opponent"])
+        uniquegames += unique
+        uniquegamesbydate[date] = unique
+    return (uniquegames,uniquegamesbydate)
+
+def load_season(fn=None):
+    """Loads the given games file (games_fn by default) the first time it is
+    asked for, and returns the same memoized season afterwards.  The season
+    is a dictionary with elements:
+    - teams: the set of team names
+    - games: every row of the file
+    - uniquegames: the games without flipped duplicates, sorted by date
+    - uniquegamesbydate: the unique games of each date
+    - gamesbyteam: the unique games each team played in
+    - history: the build_history_index of the unique games, for as-of-date
+      queries
+    """
+    if fn == None:
+        fn = games_fn
+    if fn not in loaded_seasons:
+        with hw4_profile.stage("load games") as s:
+            (teams,games) = load_typed_games(fn)
+            s.add_rows(len(games))
+        (uniquegames,uniquegamesbydate) = removeDuplicates(games)
+        gamesbyteam = defaultdict(list)
+        for game in uniquegames:
+            gamesbyteam[game['Team']].append(game)
+            gamesbyteam[game['Opponent']].append(game)
+        loaded_seasons[fn] = {'teams':teams,'games':games,'uniquegames':uniquegames,
+                              'uniquegamesbydate':uniquegamesbydate,'gamesbyteam':gamesbyteam,
+                              'history':build_history_index(uniquegames)}
+    return loaded_seasons[fn]
 
 def inGame(team,game):
     """True if the team was in the given game"""
@@ -68,11 +108,17 @@ def wonGame(team,game):
 def gamesBefore(date,team,games):
     """Returns the set of games where the team participated before the given date"""
     res = []
-    for g in gamesbyteam[team]:
-        if g["Date"]<date:
+    for g in games:
+        if g["Date"]<date and inGame(team,g):
             res.append(g)
     return res
 
+def gamesBeforeByTeam(date,team,gamesbyteam):
+    """Returns the same games as gamesBefore, given a dictionary mapping each
+    team to the games it played, such as a season's gamesbyteam, so that only
+    the team's own games are looked at"""
+    return [g for g in gamesbyteam.get(team,[]) if g["Date"]<date]
+
 def averageGained(games,team,item):
     """Returns the averagetotals of the given item over the games"""
     ingames = [g for g in games if inGame(team,g)]
@@ -104,11 +150,25 @@ def record(team,games):
     return (wins,len(ingames)-wins)
 
 def make_features(game,games):
+    """Builds the feature dictionary of a game from the list of games,
+    scanning it for the games the two teams played before it"""
+    #extract history of team and opponent
+    teamhistory = gamesBefore(game["Date"],game["Team"],games)
+    opphistory = gamesBefore(game["Date"],game["Opponent"],games)
+    return history_features(game,teamhistory,opphistory)
+
+def make_features_by_team(game,gamesbyteam):
+    """Builds the same features as make_features, looking only at the two
+    teams' own games in gamesbyteam (see gamesBeforeByTeam)"""
+    teamhistory = gamesBeforeByTeam(game["Date"],game["Team"],gamesbyteam)
+    opphistory = gamesBeforeByTeam(game["Date"],game["Opponent"],gamesbyteam)
+    return history_features(game,teamhistory,opphistory)
+
+def history_features(game,teamhistory,opphistory):
+    """Builds the feature dictionary of a game given the games the team and
+    the opponent played before it"""
     team = game["Team"]
     opponent = game["Opponent"]
-    #extract history of team and opponent
-    teamhistory = gamesBefore(game["Date"],team,games)
-    opphistory = gamesBefore(game["Date"],opponent,games)
     
     #compute the win/loss record
     teamrecord = record(team,teamhistory)
@@ -124,7 +184,12 @@ def make_features(game,games):
         oppavgstats[s] = averageGained(opphistory,opponent,s)
         oppavgstats[s+"Allowed"] = averageAllowed(opphistory,opponent,s)
         
-    #start building feature dictionary
+    return build_features(game,teamrecord,teamavgstats,opprecord,oppavgstats)
+
+def build_features(game,teamrecord,teamavgstats,opprecord,oppavgstats):
+    """Builds the feature dictionary of a game given the (wins,losses) record
+    and average statistics of the team and the opponent before the game"""
+    team = game["Team"]
     features = dict()
     features["Date"] = time.strftime("%m/%d/%Y",game["Date"])
     for k in ["Team","Opponent","Team Differential","Opponent Differential"]:
@@ -139,21 +204,188 @@ def make_features(game,games):
     features["opp_losses"]=opprecord[1]
     for (k,v) in oppavgstats.iteritems():
         features["opp_avg_"+k] = v
-    features["team_won"] = 1 if wonGame(team,game) else 0
+    if game["Team Score"] != None:
+        features["team_won"] = 1 if wonGame(team,game) else 0
     return features
 
+def build_history_index(games):
+    """Indexes the games of each team by date, so its record and average
+    statistics as of any date are a binary search and a few lookups away.
+    Returns a dictionary mapping each team to its history, a dictionary with
+    elements:
+    - dates: the dates of its games, sorted
+    - wins, losses: wins[k] is the number of its first k games it won, so
+      wins[0] is 0
+    - gained, allowed: gained[s][k] (allowed[s][k]) is the total of stat s
+      of the team (of its opponents) over its first k games
+    - differential: differential[k] is its latest differential within its
+      first k games, 0 if there is none
+    """
+    gamesbyteam = defaultdict(list)
+    for game in games:
+        gamesbyteam[game['Team']].append(game)
+        gamesbyteam[game['Opponent']].append(game)
+    index = dict()
+    for (team,tgames) in gamesbyteam.iteritems():
+        tgames.sort(key=lambda g:g["Date"])
+        wins = array('l',[0])
+        losses = array('l',[0])
+        gained = dict((s,array('d',[0.])) for s in statvars)
+        allowed = dict((s,array('d',[0.])) for s in statvars)
+        differential = array('d',[0.])
+        for g in tgames:
+            won = 1 if wonGame(team,g) else 0
+            wins.append(wins[-1]+won)
+            losses.append(losses[-1]+1-won)
+            (us,them) = ("Team ","Opponent ") if team==g["Team"] else ("Opponent ","Team ")
+            for s in statvars:
+                gained[s].append(gained[s][-1]+g[us+s])
+                allowed[s].append(allowed[s][-1]+g[them+s])
+            d = g[us+"Differential"]
+            differential.append(d if d != None else differential[-1])
+        index[team] = {'dates':[g["Date"] for g in tgames],'wins':wins,'losses':losses,
+                       'gained':gained,'allowed':allowed,'differential':differential}
+    return index
+
+def games_asof(index,team,date):
+    """The number of games the team played before the given date"""
+    if team not in index:
+        return 0
+    return bisect.bisect_left(index[team]['dates'],date)
+
+def record_asof(index,team,date):
+    """Returns the (wins,losses) record of the team before the given date"""
+    k = games_asof(index,team,date)
+    if k == 0:
+        return (0,0)
+    return (index[team]['wins'][k],index[team]['losses'][k])
+
+def averages_asof(index,team,date):
+    """Returns the average statistics of the team before the given date, as
+    computed by averageGained and averageAllowed"""
+    k = games_asof(index,team,date)
+    avgstats = {}
+    for s in statvars:
+        avgstats[s] = index[team]['gained'][s][k]/k if k > 0 else 0
+        avgstats[s+"Allowed"] = index[team]['allowed'][s][k]/k if k > 0 else 0
+    return avgstats
+
+def differential_asof(index,team,date):
+    """Returns the differential of the team in its last game before the
+    given date that has one, or 0 if there is none"""
+    k = games_asof(index,team,date)
+    return index[team]['differential'][k] if k > 0 else 0.
+
+def features_asof(game,index):
+    """Builds the same features as make_features(game,games), looking the
+    teams' history up in the build_history_index of the games"""
+    (team,opponent,date) = (game["Team"],game["Opponent"],game["Date"])
+    return build_features(game,record_asof(index,team,date),averages_asof(index,team,date),
+                          record_asof(index,opponent,date),averages_asof(index,opponent,date))
+
+def matchup_features(team,opponent,date,location="Neutral",season=None):
+    """Builds the features make_features would give a game, not yet played,
+    between team and opponent on the given date (mm/dd/yyyy), where
+    location is the team's "Home", "Away" or "Neutral".  The differentials
+    are the teams' latest before the date.  The statistics come from season
+    (load_season() by default).  There is no team_won feature."""
+    if season == None:
+        season = load_season()
+    date = time.strptime(date,"%m/%d/%Y")
+    for t in [team,opponent]:
+        if t not in season['teams']:
+            raise ValueError("unknown team %s"%(t,))
+    index = season['history']
+    opplocation = {"Home":"Away","Away":"Home"}.get(location,location)
+    game = {"Date":date,"Team":team,"Opponent":opponent,
+            "Team Location":location,"Opponent Location":opplocation,
+            "Team Score":None,"Opponent Score":None,
+            "Team Differential":differential_asof(index,team,date),
+            "Opponent Differential":differential_asof(index,opponent,date)}
+    return features_asof(game,index)
+
+def new_running_stats():
+    """Running totals of a team: wins, losses and the sums of every stat
+    gained and allowed"""
+    return {'wins':0,'losses':0,
+            'gained':dict((s,0) for s in statvars),
+            'allowed':dict((s,0) for s in statvars)}
+
+def add_game(stats,team,game):
+    """Adds a game the team played to its running totals"""
+    if wonGame(team,game):
+        stats['wins'] += 1
+    else:
+        stats['losses'] += 1
+    (us,them) = ("Team ","Opponent ") if team==game["Team"] else ("Opponent ","Team ")
+    for s in statvars:
+        stats['gained'][s] += game[us+s]
+        stats['allowed'][s] += game[them+s]
+
+def running_record(stats):
+    """Returns the (wins,losses) pair of the running totals"""
+    return (stats['wins'],stats['losses'])
+
+def running_averages(stats):
+    """Returns the average statistics of the running totals, as computed by
+    averageGained and averageAllowed"""
+    n = stats['wins']+stats['losses']
+    avgstats = {}
+    for s in statvars:
+        avgstats[s] = float(stats['gained'][s])/n if n > 0 else 0
+        avgstats[s+"Allowed"] = float(stats['allowed'][s])/n if n > 0 else 0
+    return avgstats
+
 def make_all_features(games):
-    """Outputs a feature dictionary [feature_dict(g)] for the given games"""
-    return [make_features(g,games) for g in games]
+    """Outputs a feature dictionary [feature_dict(g)] for the given games.
+
+    Produces the same features as make_features, but streams over the games
+    in date order keeping running totals per team, so it takes linear time
+    instead of rescanning each team's history for every game.  Games on the
+    same date do not see each other."""
+    with hw4_profile.stage("precompute features") as s:
+        s.add_rows(len(games))
+        return stream_features(games)
+
+def stream_features(games):
+    """Computes make_all_features in one date-ordered pass over the games"""
+    running = defaultdict(new_running_stats)
+    res = [None]*len(games)
+    order = sorted(range(len(games)),key=lambda i:games[i]["Date"])
+    start = 0
+    while start < len(order):
+        date = games[order[start]]["Date"]
+        end = start
+        while end < len(order) and games[order[end]]["Date"] == date:
+            end += 1
+        for i in order[start:end]:
+            game = games[i]
+            teamstats = running[game["Team"]]
+            oppstats = running[game["Opponent"]]
+            res[i] = build_features(game,running_record(teamstats),running_averages(teamstats),
+                                    running_record(oppstats),running_averages(oppstats))
+        for i in order[start:end]:
+            game = games[i]
+            add_game(running[game["Team"]],game["Team"],game)
+            add_game(running[game["Opponent"]],game["Opponent"],game)
+        start = end
+    return res
+
+def save_features(features,outfn):
+    """Writes the feature dictionaries to a CSV file"""
+    with open(outfn,"w") as csvfile:
+        writer = csv.DictWriter(csvfile,sorted(features[0].keys()))
+        writer.writeheader()
+        for f in features:
+            writer.writerow(f)
 
-#build the feature list
-features = make_all_features(uniquegames)
+if __name__=="__main__":
+    season = load_season()
+    print len(season['games']),"records,",len(season['uniquegames']),"unique"
 
-outfn = "2017 NCAAM Game Results Features.csv"
-print "Saving to",outfn
-with open(outfn,"w") as csvfile:
-    writer = csv.DictWriter(csvfile,sorted(features[0].keys()))
-    writer.writeheader()
-    for f in features:
-        writer.writerow(f)
+    #build the feature list
+    features = make_all_features(season['uniquegames'])
 
+    outfn = features_fn
+    print "Saving to",outfn
+    save_features(features,outfn)
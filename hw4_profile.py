@@ -0,0 +1,109 @@
+from __future__ import with_statement
+import cProfile
+import resource
+import sys
+import time
+
+#Opt-in instrumentation of the pipeline.  Stages are no-ops until enable()
+#is called, so leaving them in the hot paths costs almost nothing.
+enabled = False
+stages = dict()
+profiler = None
+
+def enable(profile=False):
+    """Starts recording stages, and if profile is True, also runs cProfile
+    until the report is dumped"""
+    global enabled,profiler
+    enabled = True
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+def disable():
+    """Stops recording stages and profiling"""
+    global enabled,profiler
+    enabled = False
+    if profiler != None:
+        profiler.disable()
+        profiler = None
+
+def reset():
+    """Forgets every recorded stage"""
+    stages.clear()
+
+def peak_rss_kb():
+    """The peak resident memory of this process so far, in kilobytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak/1024 if sys.platform == 'darwin' else peak
+
+class Stage(object):
+    """Times one run of a named stage of the pipeline, used as
+    "with stage(name) as s:".  Call s.add_rows(n) to count the rows it
+    processed.  With memory=False the peak memory is not looked at, which
+    makes the stage cheap enough to wrap around a single row."""
+
+    def __init__(self,name,memory=True):
+        self.name = name
+        self.memory = memory
+        self.rows = 0
+
+    def add_rows(self,n):
+        self.rows += n
+
+    def __enter__(self):
+        self.start_rss = peak_rss_kb() if self.memory else 0
+        self.start = time.time()
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        seconds = time.time()-self.start
+        record = stages.setdefault(self.name,{'calls':0,'seconds':0.,'rows':0,'peak_rss_increase_kb':0})
+        record['calls'] += 1
+        record['seconds'] += seconds
+        record['rows'] += self.rows
+        if self.memory:
+            record['peak_rss_increase_kb'] += peak_rss_kb()-self.start_rss
+        return False
+
+class NullStage(object):
+    """What stage returns when instrumentation is disabled"""
+
+    def add_rows(self,n):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        return False
+
+null_stage = NullStage()
+
+def stage(name,memory=True):
+    """Returns a context manager that records a run of the named stage"""
+    return Stage(name,memory) if enabled else null_stage
+
+def report():
+    """Returns the recorded stages, a dictionary mapping each stage name to
+    its number of calls, total seconds, rows, rows per second and growth of
+    the peak resident memory (in kilobytes)"""
+    res = dict()
+    for (name,record) in stages.iteritems():
+        r = dict(record)
+        r['rows_per_second'] = r['rows']/r['seconds'] if r['rows'] and r['seconds'] > 0 else None
+        res[name] = r
+    return res
+
+def print_report():
+    """Prints the report, slowest stages first"""
+    print "%-28s %6s %10s %10s %14s %10s"%("stage","calls","seconds","rows","rows/second","+peak MB")
+    for (name,r) in sorted(report().iteritems(),key=lambda nr:-nr[1]['seconds']):
+        print "%-28s %6d %10.4f %10d %14s %10.1f"%(name,r['calls'],r['seconds'],r['rows'],
+                                                 "%.0f"%r['rows_per_second'] if r['rows_per_second'] else "-",
+                                                 r['peak_rss_increase_kb']/1024.)
+
+def dump_profile(fn):
+    """Writes the cProfile statistics gathered since enable(profile=True)"""
+    if profiler == None:
+        raise ValueError("profiling was not enabled")
+    profiler.dump_stats(fn)
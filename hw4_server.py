@@ -0,0 +1,131 @@
+import asynchat
+import asyncore
+from collections import deque
+import json
+import socket
+import sys
+import time
+
+from hw4_precompute import load_season, matchup_features
+from hw4_p3 import load_dataset, transformToBooleanFeatures
+from hw4_model import NaiveBayesModel
+
+
+class MatchupPredictor(object):
+    """Answers P(team beats opponent on date) from a season's games and a
+    model, both kept in memory, and records the latency of every query."""
+
+    def __init__(self,model,season,history=10000):
+        self.model = model
+        self.season = season
+        self.latencies = deque(maxlen=history)
+
+    def predict(self,queries):
+        """Given a list of queries, dictionaries with keys team, opponent, date
+        (mm/dd/yyyy) and optionally location ("Home", "Away" or "Neutral",
+        for the team), returns one answer per query: a dictionary with p_win,
+        or with error if the query cannot be answered."""
+        t0 = time.time()
+        answers = [None]*len(queries)
+        rows = []
+        indices = []
+        win = self.model.class_codes[1]
+        for (i,q) in enumerate(queries):
+            if not isinstance(q,dict):
+                answers[i] = {'error':"a query must be a JSON object"}
+                continue
+            try:
+                features = matchup_features(q['team'],q['opponent'],q['date'],
+                                            q.get('location',"Neutral"),self.season)
+                rows.extend(self.model.encode([transformToBooleanFeatures(features)]))
+                indices.append(i)
+            except KeyError as e:
+                answers[i] = {'error':"missing %s"%(e.args[0],)}
+            except (ValueError,TypeError,AttributeError) as e:
+                answers[i] = {'error':str(e)}
+        for (i,p) in zip(indices,self.model.predict_proba(rows)):
+            answers[i] = {'p_win':p[win]}
+        self.latencies.append(time.time()-t0)
+        return answers
+
+    def latency_stats(self):
+        """Returns the number of requests and the p50 and p99 latencies, in
+        milliseconds, of the recent requests"""
+        latencies = sorted(self.latencies)
+        if len(latencies) == 0:
+            return {'requests':0,'p50_ms':None,'p99_ms':None}
+        def percentile(q):
+            return 1000*latencies[min(len(latencies)-1,int(q*len(latencies)))]
+        return {'requests':len(latencies),'p50_ms':percentile(0.5),'p99_ms':percentile(0.99)}
+
+class PredictionChannel(asynchat.async_chat):
+    """One client connection.  Each request is a line holding a JSON query
+    object, a JSON list of queries (a batch), or {"stats":true}; each answer
+    is a line of JSON, an answer object or a list of them."""
+
+    def __init__(self,sock,predictor):
+        asynchat.async_chat.__init__(self,sock)
+        self.predictor = predictor
+        self.buffer = []
+        self.set_terminator("\n")
+
+    def collect_incoming_data(self,data):
+        self.buffer.append(data)
+
+    def found_terminator(self):
+        line = "".join(self.buffer)
+        self.buffer = []
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            self.push(json.dumps({'error':str(e)})+"\n")
+            return
+        if isinstance(request,list):
+            answer = self.predictor.predict(request)
+        elif not isinstance(request,dict):
+            answer = {'error':"a request must be a JSON object or a list of them"}
+        elif request.get('stats'):
+            answer = self.predictor.latency_stats()
+        else:
+            answer = self.predictor.predict([request])[0]
+        self.push(json.dumps(answer)+"\n")
+
+class PredictionServer(asyncore.dispatcher):
+    """Accepts client connections on host:port"""
+
+    def __init__(self,predictor,host="localhost",port=8765):
+        asyncore.dispatcher.__init__(self)
+        self.predictor = predictor
+        self.create_socket(socket.AF_INET,socket.SOCK_STREAM)
+        self.set_reuse_addr()
+        self.bind((host,port))
+        self.listen(64)
+
+    def handle_accept(self):
+        pair = self.accept()
+        if pair != None:
+            PredictionChannel(pair[0],self.predictor)
+
+def ask(queries,host="localhost",port=8765):
+    """Sends one request (a query or a list of queries) to a running server
+    and returns its answer"""
+    sock = socket.create_connection((host,port))
+    try:
+        sock.sendall(json.dumps(queries)+"\n")
+        f = sock.makefile("r")
+        return json.loads(f.readline())
+    finally:
+        sock.close()
+
+if __name__=="__main__":
+    #serves the model saved at argv[1] if given, or a model trained on all
+    #the prediction variables
+    port = 8765
+    if len(sys.argv) > 1:
+        model = NaiveBayesModel.load(sys.argv[1])
+    else:
+        dataset = load_dataset()
+        model = NaiveBayesModel.learn("team_won",dataset['non_name_variables'],dataset['transformedfeatures'])
+    PredictionServer(MatchupPredictor(model,load_season()),port=port)
+    print "Serving predictions on port",port
+    asyncore.loop()
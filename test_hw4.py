@@ -0,0 +1,187 @@
+from __future__ import with_statement
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+from hw4_p2 import learn_naive_bayes
+from hw4_p3 import loadfeatures, transformToBooleanFeatures, transformToBooleanColumns, \
+     load_dataset, features_fn, learn_streaming, learn_sharded, byte_shards, model_accuracy
+from hw4_crossval import kfold_splits, walk_forward_splits, cross_validate
+from hw4_model import NaiveBayesCounts, NaiveBayesModel
+from hw4_precompute import load_season, make_all_features, make_features_by_team, features_asof
+from hw4_cache import load_columns, column_values
+
+
+def setUpModule():
+    #the data files are named relative to the repository
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+def features_row(team_differential,opponent_differential,**values):
+    """A row of a features file, as loadfeatures returns it, with the given
+    differentials and every other feature 0"""
+    row = dict(Date="11/11/2016",Team="Pepperdine",Opponent="Cal Poly",
+               at_home="0",at_opp="0",opp_avg_Score="0",opp_avg_ScoreAllowed="0",
+               opp_losses="0",opp_wins="0",team_avg_Score="0",team_avg_ScoreAllowed="0",
+               team_losses="0",team_wins="0",team_won="0")
+    row["Team Differential"] = team_differential
+    row["Opponent Differential"] = opponent_differential
+    row.update(values)
+    return row
+
+
+class BooleanFeaturesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def columns_of(self,rows):
+        """transformToBooleanColumns of the rows, written out and loaded as a
+        features file"""
+        fn = os.path.join(self.tmpdir,"features.csv")
+        names = sorted(rows[0].keys())
+        with open(fn,"wb") as f:
+            writer = csv.writer(f)
+            writer.writerow(names)
+            for row in rows:
+                writer.writerow([row[k] for k in names])
+        columns = transformToBooleanColumns(load_columns(fn))
+        return [dict((f,c[i]) for (f,c) in columns.iteritems()) for i in range(len(rows))]
+
+    def test_known_rows(self):
+        rows = loadfeatures(features_fn)
+        self.assertEqual(transformToBooleanFeatures(rows[0]),
+                         {'at_home':1,'at_opp':0,'team_won':1,
+                          'Differential_kinda_better':0,'Differential_much_better':0,
+                          'Score_avg_better':0,'ScoreAllowed_avg_better':0,
+                          'wins_better':1,'losses_better':0})
+        self.assertEqual(transformToBooleanFeatures(rows[1]),
+                         {'at_home':0,'at_opp':1,'team_won':0,
+                          'Differential_kinda_better':0,'Differential_much_better':1,
+                          'Score_avg_better':0,'ScoreAllowed_avg_better':0,
+                          'wins_better':1,'losses_better':0})
+
+    def test_differentials(self):
+        #(team,opponent,kinda better,much better); the differentials are
+        #compared as numbers, so '9.5' is below '10.0'
+        cases = [("9.5","10.0",0,0),("10.0","9.5",1,0),
+                 ("7.5","2.5",0,0),("3","3",0,0),
+                 ("8.5","2.5",0,1),("-2","-4.5",1,0)]
+        rows = [features_row(team,opponent) for (team,opponent,kinda,much) in cases]
+        for (row,columns,(team,opponent,kinda,much)) in zip(rows,self.columns_of(rows),cases):
+            features = transformToBooleanFeatures(row)
+            self.assertEqual((features["Differential_kinda_better"],features["Differential_much_better"]),
+                             (kinda,much),"%s vs %s"%(team,opponent))
+            self.assertEqual(columns,features,"%s vs %s"%(team,opponent))
+
+    def test_records_and_averages(self):
+        rows = [features_row("0","0",team_wins="3",opp_wins="3",team_losses="2",opp_losses="1",
+                             team_avg_Score="70.5",opp_avg_Score="9.5",
+                             team_avg_ScoreAllowed="60",opp_avg_ScoreAllowed="60"),
+                features_row("0","0",team_wins="2",opp_wins="10",team_losses="1",opp_losses="1",
+                             team_avg_Score="9.5",opp_avg_Score="70.5",at_home="1",team_won="1")]
+        expected = [{'at_home':0,'at_opp':0,'team_won':0,
+                     'Differential_kinda_better':0,'Differential_much_better':0,
+                     'Score_avg_better':1,'ScoreAllowed_avg_better':0,
+                     'wins_better':1,'losses_better':1},
+                    {'at_home':1,'at_opp':0,'team_won':1,
+                     'Differential_kinda_better':0,'Differential_much_better':0,
+                     'Score_avg_better':0,'ScoreAllowed_avg_better':0,
+                     'wins_better':0,'losses_better':0}]
+        self.assertEqual(map(transformToBooleanFeatures,rows),expected)
+        self.assertEqual(self.columns_of(rows),expected)
+
+    def test_columns_match_rows(self):
+        rows = loadfeatures(features_fn)
+        columns = transformToBooleanColumns(load_columns(features_fn))
+        names = columns.keys()
+        self.assertEqual([dict(zip(names,row)) for row in zip(*[columns[f] for f in names])],
+                         map(transformToBooleanFeatures,rows))
+
+
+class NaiveBayesCountsTest(unittest.TestCase):
+
+    dataset = [{'c':0,'a':1,'b':0},{'c':1,'a':1,'b':1},{'c':1,'a':0,'b':1},{'c':0,'a':0,'b':0}]
+
+    def snapshot(self,counts):
+        return (dict(counts.class_counts),
+                dict((f,dict((c,dict(vs)) for (c,vs) in fc.iteritems()))
+                     for (f,fc) in counts.feature_counts.iteritems()),
+                counts.distributions())
+
+    def test_retract_is_atomic(self):
+        counts = NaiveBayesCounts('c',['a','b'])
+        counts.add(self.dataset)
+        before = self.snapshot(counts)
+        #the first instance was added, the second never was
+        self.assertRaises(ValueError,counts.retract,[self.dataset[0],{'c':0,'a':1,'b':1}])
+        self.assertEqual(self.snapshot(counts),before)
+        self.assertRaises(ValueError,counts.retract,[self.dataset[0],self.dataset[0]])
+        self.assertEqual(self.snapshot(counts),before)
+        self.assertRaises(KeyError,counts.add,[self.dataset[0],{'c':0,'a':1}])
+        self.assertEqual(self.snapshot(counts),before)
+
+    def test_retract_equals_retraining(self):
+        counts = NaiveBayesCounts('c',['a','b'],1,1,set([0,1]),{'a':set([0,1]),'b':set([0,1])})
+        counts.add(self.dataset)
+        counts.retract(self.dataset[1:3])
+        kept = self.dataset[:1]+self.dataset[3:]
+        self.assertEqual(counts.distributions(),
+                         learn_naive_bayes('c',['a','b'],kept,1,1,set([0,1]),{'a':set([0,1]),'b':set([0,1])}))
+
+
+class TrainingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dataset = load_dataset()
+        self.prediction_variables = sorted(self.dataset['non_name_variables'])
+
+    def check_folds(self,splits):
+        """The fold models of cross_validate score the same as models trained
+        from scratch on each training set"""
+        dataset = self.dataset
+        rows = dataset['transformedfeatures']
+        labels = dataset['columns']["team_won"]
+        domains = dict((f,set(dataset['columns'][f])) for f in self.prediction_variables)
+        res = cross_validate(self.prediction_variables,splits,processes=1)
+        for ((train,test),stats) in zip(splits,res['folds']):
+            (PC,PF) = learn_naive_bayes("team_won",self.prediction_variables,[rows[i] for i in train],
+                                        1,1,set(labels),dict(domains))
+            model = NaiveBayesModel.from_dicts(PC,PF,self.prediction_variables)
+            self.assertEqual(stats,model_accuracy(model,0.5,model.encode([rows[i] for i in test]),
+                                                  [labels[i] for i in test]))
+
+    def test_kfold_models_equal_retraining(self):
+        self.check_folds(kfold_splits(len(self.dataset['transformedfeatures']),5))
+
+    def test_walk_forward_models_equal_retraining(self):
+        self.check_folds(walk_forward_splits(column_values(self.dataset['table'],"Date"),4))
+
+    def test_merged_shards_equal_single_pass(self):
+        single = learn_streaming(self.prediction_variables)
+        expected = learn_naive_bayes("team_won",self.prediction_variables,self.dataset['transformedfeatures'])
+        self.assertEqual(single.distributions(),expected)
+        for num_shards in [1,2,7]:
+            merged = learn_sharded(self.prediction_variables,byte_shards(features_fn,num_shards),processes=1)
+            self.assertEqual(dict(merged.class_counts),dict(single.class_counts))
+            self.assertEqual(merged.distributions(),expected)
+
+
+class HistoryIndexTest(unittest.TestCase):
+
+    def test_features_asof_equal_make_all_features(self):
+        for fn in ["2016 NCAAM Game Results Data.csv","2017 NCAAM Game Results Data.csv"]:
+            season = load_season(fn)
+            games = season['uniquegames']
+            expected = make_all_features(games)
+            self.assertEqual([features_asof(g,season['history']) for g in games],expected)
+            self.assertEqual([make_features_by_team(g,season['gamesbyteam']) for g in games[-200:]],
+                             expected[-200:])
+
+
+if __name__=="__main__":
+    unittest.main()